@@ -6,10 +6,16 @@ Classes handling GPIO interactions using RPi.GPIO library
 """
 
 
-from rpigpio.hx711 import HX711
+from rpigpio.hx711 import HX711, HX711Group, HX711Sampler
 from rpigpio.lcd1602 import LCD1602
 from rpigpio.rotaryencoder import RotaryEncoder
 from rpigpio.fourdigitdisplay import Display4s7s
 from rpigpio.toggle import Toggle
 from rpigpio.button import Button
+from rpigpio.debounce import Debouncer
+from rpigpio.dispatcher import EdgeDispatcher
 from rpigpio.stepper import Stepper
+from rpigpio.multistepper import MultiStepper
+from rpigpio.gpio import GPIO, set_backend, get_backend
+from rpigpio.lcdtransport import ParallelTransport, PCF8574Transport, FakeSMBus
+from rpigpio.filters import RunningMedian, EMA, TrimmedMean, Kalman1D, SpikeRejector, FilterChain
@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 
 
-import RPi.GPIO as GPIO
+if __name__ == "base":
+    from gpio import GPIO
+else:
+    from rpigpio.gpio import GPIO
 
 
 class BaseIO():
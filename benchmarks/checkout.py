@@ -0,0 +1,24 @@
+"""
+Imports the rpigpio package from this checkout, for the benchmarks and tests
+"""
+
+
+import importlib.util
+import os
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_rpigpio():
+    """
+    Import the rpigpio package from this checkout, whatever its directory is called
+    """
+    if "rpigpio" in sys.modules:
+        return sys.modules["rpigpio"]
+    spec = importlib.util.spec_from_file_location(
+            "rpigpio", os.path.join(REPO, "__init__.py"), submodule_search_locations=[REPO])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["rpigpio"] = module
+    spec.loader.exec_module(module)
+    return module
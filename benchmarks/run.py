@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks of each device driver's hot path, run against the simulated GPIO backend
+(see sim.py), so they measure the Python cost per operation without a Pi.
+
+usage:
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --compare baseline.json --threshold 0.75
+
+With --compare, each result is compared to the saved baseline and the exit code is 1
+if any benchmark is more than threshold (fractional) slower per operation. Each
+benchmark runs --warmup times untimed, then the fastest of --repeat runs is kept.
+"""
+
+
+import argparse
+import collections
+import contextlib
+import gc
+import json
+import os
+import platform
+import sys
+import time
+
+from checkout import import_rpigpio
+
+# Real timer, captured before the simulated backend patches the time module
+perf_counter = time.perf_counter
+
+os.environ["RPIGPIO_BACKEND"] = "sim"
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    """
+    Register a benchmark. func(rpigpio) returns {name: (n_ops, seconds)}
+    """
+    BENCHMARKS.append(func)
+    return func
+
+
+def timed(func, n_ops):
+    # garbage collection is paused, as timeit does, so a collection doesn't land in one run only
+    gc.disable()
+    try:
+        start = perf_counter()
+        func()
+        return n_ops, perf_counter() - start
+    finally:
+        gc.enable()
+
+
+@benchmark
+def stepper_ramp(rpigpio):
+    stepper = rpigpio.Stepper(steps_per_rev=400)
+    n_calls = 200
+
+    def build():
+        # only the acceleration steps are computed, so this is independent of n_steps
+        for i in range(n_calls):
+            stepper.clear_ramp_cache()
+            stepper.ramp(100000, 120)
+
+    n_lookups = 100000
+
+    def lookup():
+        for i in range(n_lookups):
+            stepper.ramp(100000, 120)
+    results = {
+            "stepper.ramp[build]": timed(build, n_calls),
+            "stepper.ramp[cached]": timed(lookup, n_lookups)}
+
+    # consuming the pauses is what scales with the move length
+    n_steps = 1000000
+    results["stepper.ramp[per step]"] = timed(
+            lambda: collections.deque(stepper.ramp(n_steps, 120), maxlen=0), n_steps)
+    results["stepper.ramp_iter[per step]"] = timed(
+            lambda: collections.deque(stepper.ramp_iter(n_steps, 120), maxlen=0), n_steps)
+    return results
+
+
+@benchmark
+def stepper_step(rpigpio):
+    stepper = rpigpio.Stepper(steps_per_rev=400)
+    n_steps = 20000
+    result = timed(lambda: stepper.step(n_steps, rpm=600), n_steps)
+    rpigpio.get_backend().log.clear()
+    return {"stepper.step[per pulse]": result}
+
+
+@benchmark
+def hx711_reading(rpigpio):
+    from rpigpio.sim import SimHX711
+    SimHX711(rpigpio.get_backend(), 27, 17, range(-1000, 1000, 7), period=0.0001)
+    hx = rpigpio.HX711(data=27, clock=17, printout=False)
+    n_obs = 200
+
+    def read():
+        for i in range(n_obs):
+            hx.get_reading(n_obs=3, clip=True)
+    result = timed(read, 3*n_obs)
+    hx.cleanup()
+    return {"hx711.get_reading[per conversion]": result}
+
+
+@benchmark
+def lcd_string(rpigpio):
+    lcd = rpigpio.LCD1602(data_pins=[6, 13, 19, 26], rs_pin=11, e_pin=5)
+    n_lines = 200
+
+    def write():
+        for i in range(n_lines):
+            lcd.lcd_string("Reading: {:7d}".format(i) if i % 2 else "abcdefghijklmnop", lcd.LCD_LINE_1)
+    result = timed(write, n_lines)
+    rpigpio.get_backend().log.clear()
+    return {"lcd1602.lcd_string[per line]": result}
+
+
+@benchmark
+def rotaryencoder_edge(rpigpio):
+    gpio = rpigpio.get_backend()
+    encoder = rpigpio.RotaryEncoder(clk=18, dt=15, button=14)
+    n_detents = 5000
+    sequence = [(18, 1), (15, 1), (18, 0), (15, 0)]
+
+    def turn():
+        for i in range(n_detents):
+            for channel, level in sequence:
+                gpio.set_input(channel, level)
+    result = timed(turn, 4*n_detents)
+    encoder.cleanup()
+    return {"rotaryencoder.decode_step[per edge]": result}
+
+
+@benchmark
+def display_frame(rpigpio):
+    display = rpigpio.Display4s7s()
+    n_frames = 500
+
+    def refresh():
+        # GPIO cost of one multiplex cycle, without the per-digit on-time
+        for i in range(n_frames):
+            display.output_digits([1, 2, 3, 4], hold=0)
+
+    n_shows = 20000
+
+    def show():
+        for i in range(n_shows):
+            display.show(i % 10000)
+    result = timed(refresh, n_frames)
+    display.start()  # show() returns without touching the pins
+    show_result = timed(show, n_shows)
+    display.stop()
+    rpigpio.get_backend().log.clear()
+    return {"display4s7s[per frame]": result, "display4s7s.show": show_result}
+
+
+def run(repeat=5, name_filter=None, warmup=1):
+    """
+    Run all benchmarks warmup times, discarding the results, then repeat times,
+    keeping the fastest time for each result
+    """
+    rpigpio = import_rpigpio()
+    results = {}
+    for func in BENCHMARKS:
+        if name_filter and name_filter not in func.__name__:
+            continue
+        for i in range(warmup + repeat):
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                rpigpio.set_backend("sim")
+                run_results = func(rpigpio)
+            if i < warmup:
+                continue
+            for name, (n_ops, seconds) in run_results.items():
+                if (name not in results) or (seconds < results[name]["seconds"]):
+                    results[name] = {
+                            "n_ops": n_ops,
+                            "seconds": seconds,
+                            "per_op_us": seconds / n_ops * 1e6}
+    return {
+            "meta": {
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "repeat": repeat,
+                "warmup": warmup},
+            "results": results}
+
+
+def compare(results, baseline, threshold):
+    """
+    Print per-op ratios against baseline. Returns the names of regressed benchmarks
+    """
+    regressions = []
+    print("{:45s} {:>12s} {:>12s} {:>8s}".format("benchmark", "base us/op", "new us/op", "ratio"))
+    for name, result in sorted(results["results"].items()):
+        base = baseline["results"].get(name)
+        if base is None:
+            print("{:45s} {:>12s} {:12.3f} {:>8s}".format(name, "-", result["per_op_us"], "new"))
+            continue
+        ratio = result["per_op_us"] / base["per_op_us"]
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("{:45s} {:12.3f} {:12.3f} {:8.2f}{}".format(
+            name, base["per_op_us"], result["per_op_us"], ratio, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="write results to this json file")
+    parser.add_argument("--compare", help="baseline json file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.75, help="allowed fractional slowdown per op")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark (fastest is kept)")
+    parser.add_argument("--warmup", type=int, default=1, help="runs per benchmark discarded before timing")
+    parser.add_argument("--filter", help="only run benchmarks whose function name contains this")
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.filter, args.warmup)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("{} regression(s): {}".format(len(regressions), ", ".join(regressions)))
+            sys.exit(1)
+    else:
+        for name, result in sorted(results["results"].items()):
+            print("{:45s} {:12.3f} us/op".format(name, result["per_op_us"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,19 +5,24 @@ Class to handle momentary switches
 """
 
 
-import RPi.GPIO as GPIO
 import time
 
 if __name__ == "__main__":
     from base import BaseIO
+    from gpio import GPIO
+    from debounce import Debouncer
 else:
     from rpigpio.base import BaseIO
+    from rpigpio.gpio import GPIO
+    from rpigpio.debounce import Debouncer
 
 class Button(BaseIO):
     def __init__(self, 
                  button_pin=12, 
                  pull_up=True, 
-                 debounce_delay_secs=0.05):
+                 debounce_delay_secs=0.05,
+                 pressed_level=1,
+                 dispatcher=None):
         """
         Class to handle momentary switch input.
         Note that STATE behaviour will depend on whether a pullup or pull-down resistor is used,
@@ -26,7 +31,9 @@ class Button(BaseIO):
         args:
             button_pin: (int) GPIO pin (BCM)
             pull_up: (bool) if True set pull_up_down to GPIO.PUD_UP
-            debounce_delay_secs: (float) seconds delay to handle debouncing 
+            debounce_delay_secs: (float) seconds the level must be stable for (see Debouncer)
+            pressed_level: (int) STATE while pressed, for press counting and wait_for_press()
+            dispatcher: optional EdgeDispatcher to receive edges from
         """
         GPIO.setmode(GPIO.BCM)
         
@@ -40,19 +47,35 @@ class Button(BaseIO):
         else:
             GPIO.setup(self.BUTTON, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
         time.sleep(self.DEBOUNCE_MS/1000)
-        self.STATE = GPIO.input(self.BUTTON)    
             
         # setup event detection
-        GPIO.add_event_detect(self.BUTTON, GPIO.BOTH, callback=self.set_state, bouncetime=self.DEBOUNCE_MS)
+        self.debouncer = Debouncer(
+                self.BUTTON, debounce_delay_secs, pressed_level=pressed_level, dispatcher=dispatcher)
 
-    def set_state(self, channel):
+    @property
+    def STATE(self):
         """
-        Sets and returns state using GPIO.event_detected() logic.
+        Debounced state.
         Note that STATE behaviour will depend on whether a pullup or pull-down resistor is used,
         and whether the circuit is wired normally open or normally closed.
         """
-        time.sleep(self.DEBOUNCE_MS/1000)
-        self.STATE = GPIO.input(self.BUTTON)
+        return self.debouncer.state
+
+    def get_state(self):
+        """
+        Returns the debounced state, without blocking
+        """
+        return self.debouncer.get_state()
+
+    def wait_for_press(self, timeout=None):
+        """
+        Block until the button is pressed. Returns the press timestamp, or None on timeout
+        """
+        return self.debouncer.wait_for_press(timeout)
+
+    @property
+    def presses(self):
+        return self.debouncer.presses
  
 if __name__ == "__main__":
     """
@@ -63,8 +86,8 @@ if __name__ == "__main__":
     try:
         button = Button(button_pin=12, pull_up=True)
         while True:
-            print("State: {}".format(button.STATE))
-            time.sleep(0.01)
+            if button.wait_for_press(timeout=10) is not None:
+                print("Presses: {}".format(button.presses))
     except:
         pass
     finally:
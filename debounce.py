@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+"""
+Edge-timestamp debouncing for switch inputs, shared by Button and Toggle
+"""
+
+
+import collections
+import threading
+import time
+
+if __name__ == "debounce":
+    from gpio import GPIO
+    from timers import timer_queue
+else:
+    from rpigpio.gpio import GPIO
+    from rpigpio.timers import timer_queue
+
+
+class Debouncer():
+    def __init__(self, pin, stability_secs=0.02, pressed_level=1, on_change=None, history=32, dispatcher=None):
+        """
+        Debounces a switch input without sleeping. The GPIO callback only timestamps
+        the edge and (re)arms a timer on the shared timer queue. Once the pin has
+        had no edges for stability_secs the level is read, and a change of state is
+        recorded with the time of the first edge of the burst.
+
+        args:
+            pin: (int) GPIO pin (BCM), already set up as an input
+            stability_secs: (float) time without edges before the level is accepted
+            pressed_level: (int) level that counts as pressed (or on)
+            on_change: optional function called with (level, timestamp) on each state change.
+                       Runs on the timer thread, so should be short
+            history: (int) number of state changes kept in self.history
+            dispatcher: optional EdgeDispatcher to receive edges from, instead of a GPIO callback
+        """
+        self.PIN = pin
+        self.STABILITY_SECS = stability_secs
+        self.PRESSED_LEVEL = pressed_level
+        self.on_change = on_change
+        self.state = GPIO.input(pin)
+        self.last_change = time.time()
+        self.last_press = None
+        self.presses = 0    # settled changes to pressed_level
+        self.releases = 0   # settled changes away from pressed_level
+        self.edges = 0      # raw edges seen
+        self.glitches = 0   # edge bursts that settled back to the previous state
+        self.history = collections.deque(maxlen=history)  # (timestamp, level) of state changes
+        self._cond = threading.Condition()
+        self._first_edge = None  # time of the first edge since the level last settled
+        self._timer = None
+        self.dispatcher = dispatcher
+        if dispatcher is not None:
+            dispatcher.add(pin, GPIO.BOTH, self.edge)
+        else:
+            GPIO.add_event_detect(pin, GPIO.BOTH, callback=self.edge)
+
+    def edge(self, channel, level=None, timestamp=None):
+        """
+        GPIO (or EdgeDispatcher) callback. Returns without reading the pin or sleeping
+        """
+        now = time.time() if timestamp is None else timestamp
+        with self._cond:
+            self.edges += 1
+            if self._first_edge is None:
+                self._first_edge = now
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = timer_queue.schedule(self.STABILITY_SECS, self._settle)
+
+    def _settle(self):
+        level = GPIO.input(self.PIN)
+        with self._cond:
+            timestamp = self._first_edge
+            self._first_edge = None
+            self._timer = None
+            if timestamp is None:
+                return
+            if level == self.state:
+                self.glitches += 1
+                return
+            self.state = level
+            self.last_change = timestamp
+            self.history.append((timestamp, level))
+            if level == self.PRESSED_LEVEL:
+                self.presses += 1
+                self.last_press = timestamp
+            else:
+                self.releases += 1
+            self._cond.notify_all()
+        if self.on_change is not None:
+            self.on_change(level, timestamp)
+
+    def get_state(self):
+        """
+        Returns the debounced level. Never blocks
+        """
+        return self.state
+
+    def is_pressed(self):
+        return self.state == self.PRESSED_LEVEL
+
+    def wait_for_press(self, timeout=None):
+        """
+        Block until the next press. Returns its timestamp, or None on timeout
+
+        args:
+            timeout: (float) seconds. None waits forever
+        """
+        with self._cond:
+            presses = self.presses
+            if not self._cond.wait_for(lambda: self.presses > presses, timeout):
+                return None
+            return self.last_press
+
+    def close(self):
+        if self.dispatcher is not None:
+            self.dispatcher.remove(self.PIN)
+        else:
+            GPIO.remove_event_detect(self.PIN)
+        with self._cond:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+
+"""
+Central GPIO edge dispatcher. One GPIO callback per pin records each edge into
+a ring buffer, and the edges are handed to device handlers on a pool of worker
+threads (or an asyncio loop), so a slow handler doesn't hold up the other inputs.
+"""
+
+
+import asyncio
+import collections
+import functools
+import itertools
+import queue
+import threading
+import time
+import traceback
+
+if __name__ == "__main__":
+    from gpio import GPIO
+else:
+    from rpigpio.gpio import GPIO
+
+
+class Registration():
+    def __init__(self, pins, edge, handler, priority, max_pending):
+        """
+        A handler registered with EdgeDispatcher.add(), with its pending edges and metrics.
+        Its edges (from all its pins) are handled one at a time, in the order they were recorded.
+
+        args:
+            pins: list(int). GPIO pins (BCM)
+            edge: GPIO.RISING, GPIO.FALLING or GPIO.BOTH
+            handler: function(channel, level, timestamp), or a coroutine function in asyncio mode
+            priority: (int) lower runs first when workers are busy
+            max_pending: (int) edges queued for the handler before the oldest are dropped
+        """
+        self.pins = pins
+        self.edge = edge
+        self.handler = handler
+        self.priority = priority
+        self.pending = collections.deque()
+        self.MAX_PENDING = max_pending
+        self.scheduled = False  # a drain of pending is queued or running
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.dropped = 0
+        self.latency_total = 0  # seconds from edge to handler start
+        self.latency_max = 0
+        self.run_total = 0      # seconds spent in the handler
+
+    def stats(self):
+        return {
+                "pins": self.pins,
+                "handler": getattr(self.handler, "__qualname__", repr(self.handler)),
+                "priority": self.priority,
+                "calls": self.calls,
+                "dropped": self.dropped,
+                "pending": len(self.pending),
+                "latency_mean_us": self.latency_total / self.calls * 1e6 if self.calls else 0,
+                "latency_max_us": self.latency_max * 1e6,
+                "run_mean_us": self.run_total / self.calls * 1e6 if self.calls else 0}
+
+
+class EdgeDispatcher():
+    def __init__(self, workers=2, size=1024, loop=None, max_pending=256):
+        """
+        Records GPIO edges as (pin, level, timestamp) in a ring buffer from the GPIO
+        callback, and fans them out to registered handlers.
+
+        A fan-out thread drains the ring into each matching Registration's pending
+        queue and schedules the registration by priority. Without a loop, worker
+        threads run the scheduled handlers. With a loop, handlers run on the asyncio
+        loop (coroutine handlers as tasks). Each registration handles its edges in order,
+        one at a time, and different registrations run in parallel on the workers.
+
+        args:
+            workers: (int) worker threads (ignored with loop)
+            size: (int) ring buffer capacity (edges)
+            loop: optional asyncio event loop to run handlers on
+            max_pending: (int) default per-handler pending edge limit
+        """
+        self.SIZE = size
+        self.MAX_PENDING = max_pending
+        self.loop = loop
+        self.registrations = {}  # pin: [Registration]. A Registration appears under each of its pins
+        self.overflows = 0  # edges lost because the ring buffer was full
+        self.edges = 0      # edges recorded
+        self.orphaned = 0   # registrations dropped because the asyncio loop had closed
+        self._pin_edges = {}  # pin: edge its GPIO callback detects
+
+        self._pins = [0] * size
+        self._levels = [0] * size
+        self._timestamps = [0.0] * size
+        self._head = 0  # edges written
+        self._tail = 0  # edges fanned out
+        self._cond = threading.Condition()
+        self._work = queue.PriorityQueue()  # (priority, seq, Registration)
+        self._seq = itertools.count()
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target=self._fan_out, daemon=True)]
+        if loop is None:
+            self._threads += [threading.Thread(target=self._worker, daemon=True) for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def add(self, pin, edge, handler, priority=0, max_pending=None):
+        """
+        Register handler(channel, level, timestamp) for edges on pin. Returns the Registration
+
+        args:
+            pin: (int or list(int)) GPIO pin(s) (BCM), already set up as inputs. Edges on
+                 all the pins of one registration are handled in order (e.g. a quadrature pair)
+            edge: GPIO.RISING, GPIO.FALLING or GPIO.BOTH
+            handler: callable (or coroutine function in asyncio mode)
+            priority: (int) lower runs first
+            max_pending: (int) defaults to self.MAX_PENDING
+        """
+        pins = list(pin) if isinstance(pin, (list, tuple)) else [pin]
+        registration = Registration(
+                pins, edge, handler, priority, self.MAX_PENDING if max_pending is None else max_pending)
+        for pin in pins:
+            self.registrations.setdefault(pin, []).append(registration)
+            self._detect(pin)
+        return registration
+
+    def _detect(self, pin):
+        """
+        (Re)register the GPIO callback for pin. If all the pin's registrations want the
+        same RISING or FALLING edge, only that edge is detected and its level is known
+        """
+        edges = set(registration.edge for registration in self.registrations[pin])
+        edge = edges.pop() if len(edges) == 1 else GPIO.BOTH
+        if self._pin_edges.get(pin) == edge:
+            return
+        if pin in self._pin_edges:
+            GPIO.remove_event_detect(pin)
+        if edge == GPIO.BOTH:
+            callback = self.record
+        else:
+            callback = functools.partial(self.record, level=int(edge == GPIO.RISING))
+        GPIO.add_event_detect(pin, edge, callback=callback)
+        self._pin_edges[pin] = edge
+
+    def remove(self, pin):
+        """
+        Stop dispatching edges on pin, to every handler
+        """
+        if self.registrations.pop(pin, None) is not None:
+            del self._pin_edges[pin]
+            GPIO.remove_event_detect(pin)
+
+    def record(self, channel, level=None):
+        """
+        GPIO callback: store the edge and wake the fan-out thread
+
+        args:
+            channel: pin with the edge
+            level: (int) 1 or 0 for pins detecting only rising or falling edges. Otherwise
+                   the pin is read, so a pulse shorter than the callback latency can
+                   be recorded with the level it returned to
+        """
+        timestamp = time.time()
+        if level is None:
+            level = GPIO.input(channel)
+        with self._cond:
+            i = self._head % self.SIZE
+            self._pins[i] = channel
+            self._levels[i] = level
+            self._timestamps[i] = timestamp
+            self._head += 1
+            self.edges += 1
+            if self._head - self._tail > self.SIZE:
+                self._tail = self._head - self.SIZE
+                self.overflows += 1
+            self._cond.notify()
+
+    def _fan_out(self):
+        while not self._stop.is_set():
+            with self._cond:
+                self._cond.wait_for(lambda: (self._head > self._tail) or self._stop.is_set())
+                edges = []
+                for n in range(self._tail, self._head):
+                    i = n % self.SIZE
+                    edges.append((self._pins[i], self._levels[i], self._timestamps[i]))
+                self._tail = self._head
+            ready = []
+            for channel, level, timestamp in edges:
+                for registration in self.registrations.get(channel, []):
+                    if (registration.edge == GPIO.RISING and not level) \
+                            or (registration.edge == GPIO.FALLING and level):
+                        continue
+                    with registration.lock:
+                        if len(registration.pending) >= registration.MAX_PENDING:
+                            registration.pending.popleft()
+                            registration.dropped += 1
+                        registration.pending.append((channel, level, timestamp))
+                        if not registration.scheduled:
+                            registration.scheduled = True
+                            ready.append(registration)
+            for registration in sorted(ready, key=lambda r: r.priority):
+                if self.loop is None:
+                    self._work.put((registration.priority, next(self._seq), registration))
+                else:
+                    coroutine = self._drain_async(registration)
+                    try:
+                        asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+                    except RuntimeError:
+                        # the loop has closed: nothing will run this handler again
+                        coroutine.close()
+                        self._orphan(registration)
+
+    def _orphan(self, registration):
+        """
+        Drop an asyncio mode registration whose loop has closed
+        """
+        self.orphaned += 1
+        for pin in registration.pins:
+            registrations = self.registrations.get(pin, [])
+            if registration in registrations:
+                registrations.remove(registration)
+            if not registrations:
+                self.remove(pin)
+
+    def _worker(self):
+        while True:
+            registration = self._work.get()[2]
+            if registration is None:
+                return
+            self._drain(registration)
+
+    def _next_edge(self, registration):
+        """
+        Pop registration's oldest pending edge and record its latency.
+        Returns None (and unschedules the registration) when there are none left
+        """
+        with registration.lock:
+            if not registration.pending:
+                registration.scheduled = False
+                return None
+            edge = registration.pending.popleft()
+        latency = time.time() - edge[2]
+        registration.calls += 1
+        registration.latency_total += latency
+        registration.latency_max = max(registration.latency_max, latency)
+        return edge
+
+    def _drain(self, registration):
+        """
+        Run registration's handler on each of its pending edges, in order
+        """
+        while True:
+            edge = self._next_edge(registration)
+            if edge is None:
+                return
+            start = time.time()
+            try:
+                registration.handler(*edge)
+            except Exception:
+                traceback.print_exc()
+            registration.run_total += time.time() - start
+
+    async def _drain_async(self, registration):
+        """
+        asyncio mode version of _drain(). Coroutine handlers are awaited, so each
+        edge is handled only once the previous one has finished
+        """
+        is_coroutine = asyncio.iscoroutinefunction(registration.handler)
+        while True:
+            edge = self._next_edge(registration)
+            if edge is None:
+                return
+            start = time.time()
+            try:
+                if is_coroutine:
+                    await registration.handler(*edge)
+                else:
+                    registration.handler(*edge)
+            except Exception:
+                traceback.print_exc()
+            registration.run_total += time.time() - start
+
+    def stats(self):
+        """
+        Returns a dict of dispatcher counters and a list of per-handler metrics
+        """
+        return {
+                "edges": self.edges,
+                "overflows": self.overflows,
+                "orphaned": self.orphaned,
+                "backlog": self._head - self._tail,
+                "handlers": [r.stats() for r in self._unique_registrations()]}
+
+    def _unique_registrations(self):
+        seen = []
+        for registrations in self.registrations.values():
+            seen += [r for r in registrations if r not in seen]
+        return seen
+
+    def close(self):
+        for pin in list(self.registrations):
+            self.remove(pin)
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self.loop is None:
+            for thread in self._threads[1:]:
+                self._work.put((float("-inf"), next(self._seq), None))
+
+
+if __name__ == "__main__":
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setup([14, 15], GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    dispatcher = EdgeDispatcher(workers=2)
+    dispatcher.add(14, GPIO.FALLING, lambda channel, level, timestamp: print("pin 14 fell at {}".format(timestamp)))
+    dispatcher.add(15, GPIO.BOTH, lambda channel, level, timestamp: time.sleep(1), priority=1)
+    try:
+        while True:
+            time.sleep(5)
+            print(dispatcher.stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dispatcher.close()
+        GPIO.cleanup()
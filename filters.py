@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+
+"""
+Streaming filters for sensor readings (e.g. HX711 raw values).
+Each filter takes one sample per update() call, returns the filtered value
+and keeps it in self.value. Filters can be combined with FilterChain.
+"""
+
+
+import bisect
+import collections
+import heapq
+
+
+class RunningMedian():
+    def __init__(self, window=15):
+        """
+        Median of the last window samples. The window is split into a max heap of
+        the lower half and a min heap of the upper half. Samples leaving the window
+        are deleted lazily once they reach the top of a heap, so update() is O(log window).
+        The heaps are rebuilt from the window if deleted samples pile up below the tops.
+
+        args:
+            window: (int) number of samples
+        """
+        assert window >= 1
+        self.WINDOW = window
+        self.reset()
+
+    def reset(self):
+        self.window = collections.deque()
+        self._low = []   # lower half, negated (max heap)
+        self._high = []  # upper half (min heap)
+        self._low_size = 0   # live samples in each heap, excluding those awaiting deletion
+        self._high_size = 0
+        self._delayed = {}   # value: number of copies awaiting deletion
+        self.value = None
+
+    def _prune(self, heap, sign):
+        delayed = self._delayed
+        while heap and (sign * heap[0]) in delayed:
+            value = sign * heapq.heappop(heap)
+            delayed[value] -= 1
+            if not delayed[value]:
+                del delayed[value]
+
+    def _rebuild(self):
+        ordered = sorted(self.window)
+        half = (len(ordered) + 1) // 2
+        self._low = [-v for v in ordered[:half]]
+        heapq.heapify(self._low)
+        self._high = ordered[half:]
+        self._low_size = half
+        self._high_size = len(ordered) - half
+        self._delayed = {}
+
+    def update(self, x):
+        if (not self._low) or (x <= -self._low[0]):
+            heapq.heappush(self._low, -x)
+            self._low_size += 1
+        else:
+            heapq.heappush(self._high, x)
+            self._high_size += 1
+        self.window.append(x)
+
+        if len(self.window) > self.WINDOW:
+            old = self.window.popleft()
+            self._delayed[old] = self._delayed.get(old, 0) + 1
+            if self._low and (old <= -self._low[0]):
+                self._low_size -= 1
+            else:
+                self._high_size -= 1
+            if len(self._low) + len(self._high) > 2 * self.WINDOW:
+                self._rebuild()
+        self._prune(self._low, -1)
+        self._prune(self._high, 1)
+
+        # keep the lower half the same size as the upper half, or one larger
+        if self._low_size > self._high_size + 1:
+            heapq.heappush(self._high, -heapq.heappop(self._low))
+            self._low_size -= 1
+            self._high_size += 1
+            self._prune(self._low, -1)
+        elif self._low_size < self._high_size:
+            heapq.heappush(self._low, -heapq.heappop(self._high))
+            self._low_size += 1
+            self._high_size -= 1
+            self._prune(self._high, 1)
+
+        if self._low_size > self._high_size:
+            self.value = -self._low[0]
+        else:
+            self.value = (-self._low[0] + self._high[0]) / 2
+        return self.value
+
+
+class EMA():
+    def __init__(self, alpha=0.2):
+        """
+        Exponential moving average. O(1) per sample
+
+        args:
+            alpha: (float) weight of each new sample, 0 < alpha <= 1
+        """
+        assert 0 < alpha <= 1
+        self.ALPHA = alpha
+        self.reset()
+
+    def reset(self):
+        self.value = None
+
+    def update(self, x):
+        if self.value is None:
+            self.value = x
+        else:
+            self.value += self.ALPHA * (x - self.value)
+        return self.value
+
+
+class TrimmedMean():
+    def __init__(self, window=10, trim=1):
+        """
+        Mean of the last window samples, excluding the trim highest and trim lowest.
+        The window is kept in a sorted list with a running total. Each update finds the
+        new and old samples by bisection, but inserting into and deleting from the list
+        moves up to window items, so an update is O(window). For the tens of samples
+        this is used with, that memmove costs less than a logarithmic tree in Python would
+
+        args:
+            window: (int) number of samples
+            trim: (int) samples dropped from each end
+        """
+        assert window - 2*trim >= 1
+        self.WINDOW = window
+        self.TRIM = trim
+        self.reset()
+
+    def reset(self):
+        self.window = collections.deque()
+        self._sorted = []
+        self._total = 0
+        self.value = None
+
+    def update(self, x):
+        self.window.append(x)
+        bisect.insort(self._sorted, x)
+        self._total += x
+        if len(self.window) > self.WINDOW:
+            old = self.window.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, old)]
+            self._total -= old
+        n = len(self._sorted)
+        trim = min(self.TRIM, (n - 1) // 2)  # trim less until the window has filled
+        if trim:
+            trimmed = sum(self._sorted[:trim]) + sum(self._sorted[-trim:])
+        else:
+            trimmed = 0
+        self.value = (self._total - trimmed) / (n - 2*trim)
+        return self.value
+
+
+class Kalman1D():
+    def __init__(self, process_var=1.0, measurement_var=100.0, initial=None):
+        """
+        Kalman filter for a constant (or slowly drifting) value measured with noise.
+        O(1) per sample
+
+        args:
+            process_var: (float) variance the true value drifts by per sample
+            measurement_var: (float) variance of the measurement noise
+            initial: (float) initial estimate. Defaults to the first sample
+        """
+        self.PROCESS_VAR = process_var
+        self.MEASUREMENT_VAR = measurement_var
+        self.INITIAL = initial
+        self.reset()
+
+    def reset(self):
+        self.value = self.INITIAL
+        self.variance = self.MEASUREMENT_VAR  # variance of the estimate
+
+    def update(self, x):
+        if self.value is None:
+            self.value = x
+            return self.value
+        self.variance += self.PROCESS_VAR
+        gain = self.variance / (self.variance + self.MEASUREMENT_VAR)
+        self.value += gain * (x - self.value)
+        self.variance *= (1 - gain)
+        return self.value
+
+
+class SpikeRejector():
+    def __init__(self, threshold, max_rejects=3):
+        """
+        Drops samples more than threshold away from the last accepted one, returning
+        the last accepted value instead. After max_rejects consecutive rejections the
+        sample is accepted, so a genuine step change gets through. O(1) per sample
+
+        args:
+            threshold: (float) largest accepted change between samples
+            max_rejects: (int) consecutive rejections before accepting
+        """
+        self.THRESHOLD = threshold
+        self.MAX_REJECTS = max_rejects
+        self.rejected = 0  # total samples rejected
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self._consecutive = 0
+
+    def update(self, x):
+        if (self.value is not None) and (abs(x - self.value) > self.THRESHOLD) \
+                and (self._consecutive < self.MAX_REJECTS):
+            self._consecutive += 1
+            self.rejected += 1
+            return self.value
+        self._consecutive = 0
+        self.value = x
+        return self.value
+
+
+class FilterChain():
+    def __init__(self, *filters):
+        """
+        Feeds each sample through filters in order
+
+        args:
+            filters: objects with update(x) and reset()
+        """
+        self.filters = list(filters)
+        self.value = None
+
+    def reset(self):
+        for f in self.filters:
+            f.reset()
+        self.value = None
+
+    def update(self, x):
+        for f in self.filters:
+            x = f.update(x)
+        self.value = x
+        return self.value
+
+
+if __name__ == "__main__":
+    import random
+    chain = FilterChain(SpikeRejector(threshold=500), RunningMedian(window=5), EMA(alpha=0.3))
+    for i in range(20):
+        raw = 1000 + random.gauss(0, 50) + (10000 if i == 10 else 0)
+        print("{:10.1f} {:10.1f}".format(raw, chain.update(raw)))
@@ -1,40 +1,54 @@
 #!/usr/bin/env python3
 
 
-import RPi.GPIO as GPIO
+import threading
 import time
 
 if __name__ == "__main__":
     from base import BaseIO
+    from gpio import GPIO
 else:
     from rpigpio.base import BaseIO
+    from rpigpio.gpio import GPIO
 
 class Display4s7s(BaseIO):
     def __init__(
             self,
             segment_pins=(2, 3, 4, 17, 27, 22, 10, 9),
-            digit_pins=(5, 6, 13, 19)):
+            digit_pins=(5, 6, 13, 19),
+            digit_hz=500):
         """
         4 Digit, 7 Segment display
 
+        show() sets the value displayed, without blocking. A background thread
+        multiplexes the digits, lighting each for an equal slot of 1/(digit_hz * n_digits)
+        seconds on a fixed schedule. show() builds a new frame and swaps it in, and the
+        thread only picks up the new frame at the start of a refresh cycle.
+
         args:
             segment_pins: (tuple(ints)). output pins to control digit segments (BCM)
                     ** order must be bl, bm, dot, br, mid, tm, tl, tr
             digit_pins: (tuple(ints)). output pins to control which digit to control
+            digit_hz: (float) times per second each digit is lit
         """
-        GPIO.set_mode(GPIO.BCM)
+        GPIO.setmode(GPIO.BCM)
         self.segment_pins = segment_pins
         self.digit_pins = digit_pins
-        self.setup_pinouts(segment_pins)
-        self.setup_pinouts(digit_pins)
+        self.DIGIT_HZ = digit_hz
+        self.setup_pinouts()
         self.define_segment_map()
         self.define_number_map()
+        self.define_char_levels()
+
+        self._frame = (self.char_levels[" "],) * len(self.digit_pins)  # front buffer, swapped by show()
+        self._thread = None
+        self._stop = threading.Event()
+        self.cycles = 0  # refresh cycles completed
+        self.late = 0    # slots that overran by more than a slot, after which the schedule restarts
 
     def setup_pinouts(self):    
         """
-        Setup pins as GPIO.out
-        args:
-            pins: tuple(int))
+        Setup segment and digit pins as GPIO.OUT
         """
         for pin in self.segment_pins:
             GPIO.setup(pin, GPIO.OUT, initial=GPIO.LOW)
@@ -58,35 +72,144 @@ class Display4s7s(BaseIO):
                 "tr": {"display_pin": 7, "bcm_pin": self.segment_pins[7]},  # top right segment
                 }
 
-        def define_number_map(self):
-            """
-            map numbers 0-9 to appropriate segments
-            """
-            self.number_map = {
-                    0: {"bl":0, "bm":0, "br":0, "mid":0, "tl":0, "tm":0, "tr":0, "dot":0},
-                    1: {"bl":0, "bm":0, "br":1, "mid":0, "tl":0, "tm":0, "tr":1, "dot":0},
-                    2: {"bl":1, "bm":1, "br":0, "mid":1, "tl":0, "tm":1, "tr":1, "dot":0},
-                    3: {"bl":0, "bm":1, "br":1, "mid":1, "tl":0, "tm":1, "tr":1, "dot":0},
-                    4: {"bl":0, "bm":0, "br":1, "mid":1, "tl":1, "tm":0, "tr":1, "dot":0},
-                    5: {"bl":0, "bm":1, "br":1, "mid":1, "tl":1, "tm":1, "tr":0, "dot":0},
-                    6: {"bl":1, "bm":1, "br":1, "mid":1, "tl":1, "tm":1, "tr":0, "dot":0},
-                    7: {"bl":0, "bm":0, "br":1, "mid":0, "tl":0, "tm":1, "tr":0, "dot":0},
-                    8: {"bl":1, "bm":1, "br":1, "mid":1, "tl":1, "tm":1, "tr":1, "dot":0},
-                    9: {"bl":0, "bm":1, "br":1, "mid":1, "tl":1, "tm":1, "tr":1, "dot":0},
-                    }
-
-        def output_digit(self, digit):
-            """
-            Handles GPIO segment output for the input digit
-            """
-            for k in self.segment_map.keys():
-                GPIO.output(self.segment_map[k]["bcm_pin"], self.number_map[digit][k]) 
-                time.sleep(0.001)
-
-        def output_digits(self, digits):
-            for i in range(len(digits)):
-                GPIO.output(self.digit_pins[i], 0) 
-                self.output_digit(digits[i])
-                GPIO.output(self.digit_pins[i], 1) 
+    def define_number_map(self):
+        """
+        map numbers 0-9 to appropriate segments
+        """
+        self.number_map = {
+                0: {"bl":1, "bm":1, "br":1, "mid":0, "tl":1, "tm":1, "tr":1, "dot":0},
+                1: {"bl":0, "bm":0, "br":1, "mid":0, "tl":0, "tm":0, "tr":1, "dot":0},
+                2: {"bl":1, "bm":1, "br":0, "mid":1, "tl":0, "tm":1, "tr":1, "dot":0},
+                3: {"bl":0, "bm":1, "br":1, "mid":1, "tl":0, "tm":1, "tr":1, "dot":0},
+                4: {"bl":0, "bm":0, "br":1, "mid":1, "tl":1, "tm":0, "tr":1, "dot":0},
+                5: {"bl":0, "bm":1, "br":1, "mid":1, "tl":1, "tm":1, "tr":0, "dot":0},
+                6: {"bl":1, "bm":1, "br":1, "mid":1, "tl":1, "tm":1, "tr":0, "dot":0},
+                7: {"bl":0, "bm":0, "br":1, "mid":0, "tl":0, "tm":1, "tr":0, "dot":0},
+                8: {"bl":1, "bm":1, "br":1, "mid":1, "tl":1, "tm":1, "tr":1, "dot":0},
+                9: {"bl":0, "bm":1, "br":1, "mid":1, "tl":1, "tm":1, "tr":1, "dot":0},
+                }
+
+    def define_char_levels(self):
+        """
+        Segment pin levels for each displayable character, in self.segment_pins order,
+        so a digit is written with one GPIO.output() call
+        """
+        self.segment_order = [k for pin in self.segment_pins
+                              for k in self.segment_map if self.segment_map[k]["bcm_pin"] == pin]
+        self.char_levels = {
+                str(number): tuple(segments[k] for k in self.segment_order)
+                for number, segments in self.number_map.items()}
+        self.char_levels[" "] = tuple(0 for k in self.segment_order)
+        self.char_levels["-"] = tuple(int(k == "mid") for k in self.segment_order)
+        self.DOT_INDEX = self.segment_order.index("dot")
+
+    def build_frame(self, value, decimals=None):
+        """
+        Returns the tuple of per-digit segment levels showing value, right aligned
+
+        args:
+            value: (int, float or str). Strings may contain 0-9, space, - and .
+            decimals: (int) if set, number of decimal places value is formatted with
+        """
+        text = "{:.{}f}".format(value, decimals) if decimals is not None else str(value)
+        cells = []
+        for char in text:
+            if (char == ".") and cells:
+                levels = list(cells[-1])
+                levels[self.DOT_INDEX] = 1
+                cells[-1] = tuple(levels)
+            else:
+                cells.append(self.char_levels[char])
+        assert len(cells) <= len(self.digit_pins), "{} doesn't fit on the display".format(text)
+        return (self.char_levels[" "],) * (len(self.digit_pins) - len(cells)) + tuple(cells)
+
+    def show(self, value, decimals=None):
+        """
+        Display value. Returns immediately; starts the refresh thread if needed
+
+        args:
+            value: see build_frame()
+            decimals: see build_frame()
+        """
+        self._frame = self.build_frame(value, decimals)
+        if self._thread is None:
+            self.start()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._refresh, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop the refresh thread and blank the display
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _drive_digit(self, i, levels):
+        """
+        Light digit i with the given segment levels (all other digits off)
+        """
+        GPIO.output(self.digit_pins, 1)
+        GPIO.output(self.segment_pins, levels)
+        GPIO.output(self.digit_pins[i], 0)
+
+    def _refresh(self):
+        n_digits = len(self.digit_pins)
+        slot = 1 / (self.DIGIT_HZ * n_digits)
+        next_slot = time.perf_counter()
+        while not self._stop.is_set():
+            frame = self._frame  # swap in the latest frame once per cycle
+            for i in range(n_digits):
+                self._drive_digit(i, frame[i])
+                next_slot += slot
+                delay = next_slot - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -slot:
+                    self.late += 1
+                    next_slot = time.perf_counter()
+            self.cycles += 1
+        GPIO.output(self.digit_pins, 1)
+
+    def output_digit(self, digit):
+        """
+        Handles GPIO segment output for the input digit
+        """
+        GPIO.output(self.segment_pins, self.char_levels[str(digit)])
+
+    def output_digits(self, digits, hold=0.001):
+        """
+        Multiplex digits once from the calling thread, lighting each for hold seconds.
+        Use show() to keep the display refreshed in the background
+
+        args:
+            digits: list(int)
+            hold: (float) seconds each digit is lit
+        """
+        for i in range(len(digits)):
+            self._drive_digit(i, self.char_levels[str(digits[i])])
+            time.sleep(hold)
+        GPIO.output(self.digit_pins, 1)
+
+    def cleanup(self):
+        self.stop()
+        super().cleanup()
+
+
+if __name__ == "__main__":
+    try:
+        display = Display4s7s()
+        for i in range(10000):
+            display.show(i)
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        display.cleanup() 
 
 
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+
+"""
+Pluggable GPIO backends.
+
+Device classes use the GPIO object exported here rather than importing RPi.GPIO
+directly. It forwards to the active backend, which is chosen with the
+RPIGPIO_BACKEND environment variable ("rpi" (default), "mmap", "sim") or set_backend().
+Each backend mirrors the subset of the RPi.GPIO API used by rpigpio. Passing lists
+of channels and values to output() writes several pins in one call.
+"""
+
+
+import importlib
+import mmap
+import os
+import threading
+import time
+
+
+class GPIOBackend():
+    """
+    Base class for GPIO backends. Constants match RPi.GPIO
+    """
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def setmode(self, mode):
+        raise NotImplementedError
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, channel, direction, pull_up_down=PUD_OFF, initial=None):
+        raise NotImplementedError
+
+    def output(self, channel, value):
+        raise NotImplementedError
+
+    def input(self, channel):
+        raise NotImplementedError
+
+    def input_levels(self, channels):
+        """
+        Returns the levels of several pins. Backends that can read all levels at once override this
+        """
+        return [self.input(channel) for channel in channels]
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        raise NotImplementedError
+
+    def remove_event_detect(self, channel):
+        raise NotImplementedError
+
+    def wait_for_edge(self, channel, edge, bouncetime=None, timeout=None):
+        """
+        Block until an edge on channel. Returns channel, or None after timeout (ms)
+        """
+        raise NotImplementedError
+
+    def event_detected(self, channel):
+        raise NotImplementedError
+
+    def cleanup(self, channel=None):
+        raise NotImplementedError
+
+    def activate(self):
+        """
+        Called when set_backend() makes this the active backend, after the previous
+        backend has been closed
+        """
+        pass
+
+    def close(self):
+        """
+        Release backend resources. Called when set_backend() replaces this backend
+        """
+        pass
+
+
+class RPiGPIOBackend(GPIOBackend):
+    def __init__(self):
+        """
+        Backend using the RPi.GPIO library. The RPi.GPIO functions are bound
+        directly onto the instance, so there is no wrapper overhead per call
+        """
+        import RPi.GPIO
+        for name in [
+                "BOARD", "BCM", "OUT", "IN", "LOW", "HIGH", "PUD_OFF", "PUD_DOWN", "PUD_UP",
+                "RISING", "FALLING", "BOTH", "setmode", "setwarnings", "setup", "output",
+                "input", "add_event_detect", "remove_event_detect", "wait_for_edge", "event_detected",
+                "cleanup"]:
+            setattr(self, name, getattr(RPi.GPIO, name))
+
+
+class MMapGPIOBackend(GPIOBackend):
+    # 32 bit register offsets (in words) within the GPIO register block
+    GPFSEL0 = 0x00 // 4
+    GPSET0 = 0x1C // 4
+    GPCLR0 = 0x28 // 4
+    GPLEV0 = 0x34 // 4
+    GPPUD = 0x94 // 4
+    GPPUDCLK0 = 0x98 // 4
+    GPIO_PUP_PDN_CNTRL_REG0 = 0xE4 // 4
+    BLOCK_SIZE = 4096
+
+    def __init__(self, path="/dev/gpiomem", soc="bcm2711", poll_interval=0.001):
+        """
+        Backend driving the GPIO registers directly through a memory map of
+        /dev/gpiomem. output() writes a whole pin mask with one store to the
+        set register and one to the clear register. Only bank 0 (GPIO 0-31) is supported.
+        Edge detection is emulated by a thread polling the level register.
+
+        args:
+            path: (str) register block to map. A regular file (extended to BLOCK_SIZE
+                  if needed) can stand in for the registers when testing
+            soc: (str) "bcm2711" (Pi 4) or "bcm2835" (earlier models). Selects the pull up/down registers
+            poll_interval: (float) seconds between level register polls for edge detection
+        """
+        assert soc in ["bcm2711", "bcm2835"]
+        self.SOC = soc
+        self.POLL_INTERVAL = poll_interval
+        self._fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        if os.fstat(self._fd).st_size < self.BLOCK_SIZE and os.path.isfile(path):
+            os.ftruncate(self._fd, self.BLOCK_SIZE)
+        self._mm = mmap.mmap(self._fd, self.BLOCK_SIZE)
+        self._regs = memoryview(self._mm).cast("I")
+        self._channels = set()
+        self._events = {}  # channel: [edge, callback, bouncetime_secs, last_event_time, detected]
+        self._poll_thread = None
+        self._poll_stop = threading.Event()
+
+    def setmode(self, mode):
+        assert mode == self.BCM, "MMapGPIOBackend only supports BCM numbering"
+
+    def _channel_list(self, channel):
+        """
+        Flattens channel (int or (nested) list of ints) into a list
+        """
+        if isinstance(channel, (list, tuple)):
+            return [c for sub in channel for c in self._channel_list(sub)]
+        assert 0 <= channel < 32, "MMapGPIOBackend only supports GPIO 0-31"
+        return [channel]
+
+    def setup(self, channel, direction, pull_up_down=GPIOBackend.PUD_OFF, initial=None):
+        regs = self._regs
+        for pin in self._channel_list(channel):
+            if direction == self.OUT:
+                if initial is not None:
+                    self.output(pin, initial)
+            else:
+                self._set_pull(pin, pull_up_down)
+            reg = self.GPFSEL0 + pin // 10
+            shift = (pin % 10) * 3
+            regs[reg] = (regs[reg] & ~(0b111 << shift)) | (int(direction == self.OUT) << shift)
+            self._channels.add(pin)
+
+    def _set_pull(self, pin, pull_up_down):
+        regs = self._regs
+        if self.SOC == "bcm2711":
+            bits = {self.PUD_OFF: 0b00, self.PUD_UP: 0b01, self.PUD_DOWN: 0b10}[pull_up_down]
+            reg = self.GPIO_PUP_PDN_CNTRL_REG0 + pin // 16
+            shift = (pin % 16) * 2
+            regs[reg] = (regs[reg] & ~(0b11 << shift)) | (bits << shift)
+        else:
+            regs[self.GPPUD] = {self.PUD_OFF: 0b00, self.PUD_DOWN: 0b01, self.PUD_UP: 0b10}[pull_up_down]
+            time.sleep(0.00001)  # >150 core cycles of setup time
+            regs[self.GPPUDCLK0] = 1 << pin
+            time.sleep(0.00001)
+            regs[self.GPPUD] = 0
+            regs[self.GPPUDCLK0] = 0
+
+    def output(self, channel, value):
+        """
+        Set one pin, or several pins with one store per register
+
+        args:
+            channel: (int or list(int))
+            value: (int or list(int)). One value, or one value per channel
+        """
+        regs = self._regs
+        if isinstance(channel, int):
+            if value:
+                regs[self.GPSET0] = 1 << channel
+            else:
+                regs[self.GPCLR0] = 1 << channel
+            return
+        set_mask = 0
+        clear_mask = 0
+        if isinstance(value, (list, tuple)):
+            for pin, level in zip(channel, value):
+                if level:
+                    set_mask |= 1 << pin
+                else:
+                    clear_mask |= 1 << pin
+        else:
+            for pin in channel:
+                if value:
+                    set_mask |= 1 << pin
+                else:
+                    clear_mask |= 1 << pin
+        if set_mask:
+            regs[self.GPSET0] = set_mask
+        if clear_mask:
+            regs[self.GPCLR0] = clear_mask
+
+    def input(self, channel):
+        return (self._regs[self.GPLEV0] >> channel) & 1
+
+    def input_levels(self, channels):
+        """
+        Levels of several pins from one read of the level register
+        """
+        levels = self._regs[self.GPLEV0]
+        return [(levels >> channel) & 1 for channel in channels]
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        bouncetime_secs = (bouncetime or 0) / 1000
+        self._events[channel] = [edge, callback, bouncetime_secs, 0, False]
+        if self._poll_thread is None:
+            self._poll_stop.clear()
+            self._poll_thread = threading.Thread(target=self._poll, daemon=True)
+            self._poll_thread.start()
+
+    def remove_event_detect(self, channel):
+        self._events.pop(channel, None)
+
+    def event_detected(self, channel):
+        event = self._events.get(channel)
+        if (event is None) or (not event[4]):
+            return False
+        event[4] = False
+        return True
+
+    def wait_for_edge(self, channel, edge, bouncetime=None, timeout=None):
+        """
+        Sleeps between level register polls until the edge. Returns channel, or None after timeout (ms)
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout / 1000
+        last = (self._regs[self.GPLEV0] >> channel) & 1
+        while (deadline is None) or (time.monotonic() < deadline):
+            time.sleep(self.POLL_INTERVAL)
+            level = (self._regs[self.GPLEV0] >> channel) & 1
+            if level != last:
+                last = level
+                if not ((edge == self.RISING and not level) or (edge == self.FALLING and level)):
+                    return channel
+        return None
+
+    def _poll(self):
+        """
+        Poll the level register and dispatch edges to registered callbacks
+        """
+        last_levels = self._regs[self.GPLEV0]
+        while not self._poll_stop.wait(self.POLL_INTERVAL):
+            levels = self._regs[self.GPLEV0]
+            changed = levels ^ last_levels
+            last_levels = levels
+            if not changed:
+                continue
+            now = time.time()
+            for channel, event in list(self._events.items()):
+                if not (changed >> channel) & 1:
+                    continue
+                rising = (levels >> channel) & 1
+                edge = event[0]
+                if (edge == self.RISING and not rising) or (edge == self.FALLING and rising):
+                    continue
+                if now - event[3] < event[2]:
+                    continue
+                event[3] = now
+                event[4] = True
+                if event[1] is not None:
+                    event[1](channel)
+
+    def cleanup(self, channel=None):
+        pins = self._channel_list(channel) if channel is not None else list(self._channels)
+        for pin in pins:
+            self.remove_event_detect(pin)
+            self.setup(pin, self.IN)
+            self._channels.discard(pin)
+        if (not self._events) and (self._poll_thread is not None):
+            self._poll_stop.set()
+            self._poll_thread.join()
+            self._poll_thread = None
+
+    def close(self):
+        self._events.clear()
+        if self._poll_thread is not None:
+            self._poll_stop.set()
+            self._poll_thread.join()
+            self._poll_thread = None
+        self._regs.release()
+        self._mm.close()
+        os.close(self._fd)
+
+
+# name: (module, class) of selectable backends. Modules are imported on first use
+BACKENDS = {
+        "rpi": ("gpio", "RPiGPIOBackend"),
+        "mmap": ("gpio", "MMapGPIOBackend"),
+        "sim": ("sim", "SimGPIO")}
+
+_backend = None
+
+
+def set_backend(backend):
+    """
+    Select the backend used by the GPIO object
+
+    args:
+        backend: (str or GPIOBackend). A BACKENDS key, or a backend instance
+    """
+    global _backend
+    if (_backend is not None) and (_backend is not backend):
+        _backend.close()
+    if isinstance(backend, str):
+        module_name, class_name = BACKENDS[backend.lower()]
+        if __package__:
+            module = importlib.import_module("." + module_name, __package__)
+        else:
+            module = importlib.import_module(module_name)
+        backend = getattr(module, class_name)()
+    _backend = backend
+    backend.activate()
+    GPIO.__dict__.clear()  # drop attributes cached from the previous backend
+    return backend
+
+
+def get_backend():
+    """
+    Returns the active backend, creating the RPIGPIO_BACKEND default on first use
+    """
+    if _backend is None:
+        set_backend(os.environ.get("RPIGPIO_BACKEND", "rpi"))
+    return _backend
+
+
+class _GPIOProxy():
+    """
+    Forwards attribute access to the active backend. Attributes are cached on
+    first access, so subsequent lookups cost the same as on a module
+    """
+    def __getattr__(self, name):
+        value = getattr(get_backend(), name)
+        self.__dict__[name] = value
+        return value
+
+
+GPIO = _GPIOProxy()
@@ -1,16 +1,73 @@
 #!/usr/bin/env python3
 
 
-import RPi.GPIO as GPIO
+import array
+import os
+import statistics
+import struct
+import threading
 import time
 
+import numpy as np
+
 if __name__ == "__main__":
     from base import BaseIO
+    from gpio import GPIO
 else:
     from rpigpio.base import BaseIO
+    from rpigpio.gpio import GPIO
+
+# Recording file layout: RECORD_MAGIC, the uint64 sample count, then the
+# samples as RECORD_DTYPE records (little endian, packed).
+# HX711Group recordings start with GROUP_RECORD_MAGIC, the uint64 sample count and
+# the uint64 number of chips, then group_record_dtype(n_chips) records
+RECORD_MAGIC = b"HX711REC"
+RECORD_HEADER_SIZE = len(RECORD_MAGIC) + 8
+RECORD_DTYPE = np.dtype([("timestamp", "<f8"), ("raw", "<u4")])
+GROUP_RECORD_MAGIC = b"HX711GRP"
+GROUP_RECORD_HEADER_SIZE = RECORD_HEADER_SIZE + 8
+
+
+def group_record_dtype(n_chips):
+    return np.dtype([("timestamp", "<f8"), ("raw", "<u4", (n_chips,))])
+
+
+def to_signed(raw):
+    """
+    Vectorized conversion of unsigned 24 bit HX711 counts to signed int32
+
+    args:
+        raw: (array-like) unsigned counts
+    """
+    return (np.asarray(raw, dtype=np.uint32) << 8).view(np.int32) >> 8
+
+
+def read_recording(path):
+    """
+    Returns (values, timestamps) from a recording made by HX711.record() or HX711Group.record().
+    Group recordings' values have one column per chip. Only the samples counted in
+    the header are returned, so it is safe to call while recording
+
+    args:
+        path: (str) recording file
+    """
+    with open(path, "rb") as f:
+        magic = f.read(len(RECORD_MAGIC))
+        assert magic in (RECORD_MAGIC, GROUP_RECORD_MAGIC), "{} is not an HX711 recording".format(path)
+        count = struct.unpack("<Q", f.read(8))[0]
+        if magic == GROUP_RECORD_MAGIC:
+            n_chips = struct.unpack("<Q", f.read(8))[0]
+            dtype, offset, shape = group_record_dtype(n_chips), GROUP_RECORD_HEADER_SIZE, (0, n_chips)
+        else:
+            dtype, offset, shape = RECORD_DTYPE, RECORD_HEADER_SIZE, (0,)
+    if count == 0:
+        return np.empty(shape, dtype=np.int32), np.empty(0, dtype=np.float64)
+    records = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+    return to_signed(records["raw"]), np.array(records["timestamp"])
+
 
 class HX711(BaseIO):
-    def __init__(self, data=27, clock=17, channel="A", gain=128, printout=True):
+    def __init__(self, data=27, clock=17, channel="A", gain=128, printout=True, timeout=1.0, sps=10):
         """
         Bit bangs data from HX711 using RPi.GPIO library.
         The general logic for the HX711 is:
@@ -27,6 +84,9 @@ class HX711(BaseIO):
             channel: (str) A (must be 64 or 128 gain) or B (32 gain)
             gain: see channel comments
             printout: whether to print results
+            timeout: (float) seconds to wait for a conversion before raising TimeoutError.
+                     DOUT stays high while the chip is powered down or disconnected
+            sps: (int) output data rate selected by the RATE pin (10 or 80). Used to count missed conversions
         """
         GPIO.setmode(GPIO.BCM)
         self.DATA = data
@@ -34,6 +94,11 @@ class HX711(BaseIO):
         self.CHANNEL = channel
         self.GAIN = gain
         self.PRINTOUT = printout
+        self.TIMEOUT = timeout
+        self.SPS = sps
+        self.MAX_CLOCK_HIGH = 0.00006  # CLOCK high for longer than this powers the chip down
+        self.MAX_RETRIES = 5           # bad conversions in a row before giving up
+        self.reset_health()
         self.setup_pins()
         self.setup_channel_gain()
 
@@ -81,6 +146,132 @@ class HX711(BaseIO):
             self.EXTRA_PULSES = 1
         print("Pulses: {}".format(self.EXTRA_PULSES))
 
+    def _wait_ready(self, timeout=None):
+        """
+        Sleep in GPIO.wait_for_edge() until DOUT falls (a conversion is ready).
+        Raises TimeoutError after timeout seconds (defaults to self.TIMEOUT)
+        """
+        timeout = self.TIMEOUT if timeout is None else timeout
+        self._wait_low(self.DATA, time.monotonic() + timeout, timeout)
+
+    def _wait_low(self, pin, deadline, timeout):
+        """
+        Wait until DOUT pin is low, or raise TimeoutError once time.monotonic() passes deadline.
+        DOUT stays low until clocked, so if it falls just before wait_for_edge() is armed
+        no edge follows. The wait is therefore made in slices of 2 conversion periods,
+        rechecking the level between them
+        """
+        while GPIO.input(pin) != 0:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("HX711 (DOUT pin {}) not ready after {}s".format(pin, timeout))
+            GPIO.wait_for_edge(pin, GPIO.FALLING, timeout=max(int(min(remaining, 2 / self.SPS)*1000), 1))
+
+    def _shift_in(self):
+        """
+        Clock out a ready conversion, then send the extra CLOCK pulses for the
+        configured channel and gain. Each CLOCK high is timed. Returns the unsigned
+        24 bit count, or None if a high lasted longer than MAX_CLOCK_HIGH
+        """
+        perf_counter = time.perf_counter
+        longest = 0
+        # start the data reading process, using the CLOCK pin
+        self.data_ready = True
+        for i in range(24):
+            high_at = perf_counter()
+            GPIO.output(self.CLOCK, GPIO.HIGH)
+            GPIO.output(self.CLOCK, GPIO.LOW)
+            longest = max(longest, perf_counter() - high_at)
+            bitval = GPIO.input(self.DATA)
+            self.raw_value = (self.raw_value << 1) + bitval
+        value = self.raw_value
+        # Communicate the selected channel and gain settings
+        for i in range(self.EXTRA_PULSES):
+            high_at = perf_counter()
+            GPIO.output(self.CLOCK, GPIO.HIGH)
+            GPIO.output(self.CLOCK, GPIO.LOW)
+            longest = max(longest, perf_counter() - high_at)
+        self._reset_state()
+        self.max_clock_high = max(self.max_clock_high, longest)
+        if longest > self.MAX_CLOCK_HIGH:
+            return None
+        return value
+
+    def reset_health(self):
+        """
+        Zero the conversion health counters (see health())
+        """
+        self.conversions = 0      # good conversions read
+        self.retries = 0          # conversions discarded and read again
+        self.missed = 0           # conversions the chip made that were never read, while reading continuously
+        self.saturated = 0        # conversions at full scale (0x7FFFFF or 0x800000)
+        self.max_clock_high = 0   # longest CLOCK high seen (seconds)
+        self._health_since = time.time()
+        self._last_ready = None
+        self._discard = 0
+
+    def health(self):
+        """
+        Returns a dict of conversion health counters since reset_health()
+        """
+        elapsed = time.time() - self._health_since
+        return {
+                "conversions": self.conversions,
+                "samples_per_sec": self.conversions / elapsed if elapsed > 0 else 0,
+                "retries": self.retries,
+                "missed": self.missed,
+                "saturated": self.saturated,
+                "max_clock_high_us": self.max_clock_high * 1e6}
+
+    def _read_conversion(self, timeout=None):
+        """
+        Wait for and read the next good conversion. Conversions with an over-long
+        CLOCK high are discarded and read again. Returns (timestamp, unsigned count)
+
+        args:
+            timeout: (float) seconds to wait for each conversion. Defaults to self.TIMEOUT
+        """
+        for attempt in range(self.MAX_RETRIES + 1):
+            wait_start = time.time()
+            self._wait_ready(timeout)
+            timestamp = time.time()
+            # only count misses when the next conversion was asked for within a period of the
+            # last one, i.e. when reading continuously. Pauses between on-demand reads aren't misses
+            if (self._last_ready is not None) and (wait_start - self._last_ready < 1 / self.SPS):
+                self.missed += max(int(round((timestamp - self._last_ready) * self.SPS)) - 1, 0)
+            self._last_ready = timestamp
+            raw = self._shift_in()
+            if raw is None:
+                # the chip may have powered down, which resets it to channel A, gain 128.
+                # If that isn't the setting, the first conversion after it wakes is wrong too
+                self.retries += 1
+                self._discard = int(self.EXTRA_PULSES != 1)
+                continue
+            if self._discard:
+                self.retries += 1
+                self._discard -= 1
+                continue
+            self.conversions += 1
+            for value in (raw if isinstance(raw, list) else [raw]):
+                if value in (0x7FFFFF, 0x800000):
+                    self.saturated += 1
+            return timestamp, raw
+        raise RuntimeError("HX711: {} bad conversions in a row (CLOCK high > {}us)".format(
+            self.MAX_RETRIES + 1, self.MAX_CLOCK_HIGH * 1e6))
+
+    def read_raw(self, timeout=None):
+        """
+        Wait for the next good conversion and return it as a signed 24 bit int.
+        Between conversions the thread sleeps until DOUT falls
+
+        args:
+            timeout: (float) seconds. Defaults to self.TIMEOUT
+        """
+        value = self._read_conversion(timeout)[1]
+        if value & 0x800000:  # unsigned to signed
+            value -= 0x1000000
+        return value
+
     def get_reading(self, n_obs=5, clip=True):
         """
         Return a single reading (or average of n_obs readings)
@@ -92,27 +283,111 @@ class HX711(BaseIO):
         assert (n_obs - (2*clip) >= 1)
         vals = []
         while len(vals) < n_obs:
-            if (not self.data_ready) & GPIO.input(self.DATA)==0:#(GPIO.event_detected(self.DATA)):
-                # start the data reading process, using the CLOCK pin
-                self.data_ready = True
-                for i in range(24):
-                    GPIO.output(self.CLOCK, GPIO.HIGH)
-                    GPIO.output(self.CLOCK, GPIO.LOW)
-                    bitval = GPIO.input(self.DATA)
-                    self.raw_value = (self.raw_value << 1) + bitval
-                if self.raw_value & 0x800000:  # unsigned to signed
-                    self.raw_value |= ~0xffffff
-                vals.append(self.raw_value)
-                # Communicate the selected channel and gain settings
-                for i in range(self.EXTRA_PULSES):
-                    GPIO.output(self.CLOCK, GPIO.HIGH)
-                    GPIO.output(self.CLOCK, GPIO.LOW)
-                self._reset_state()
-        reading = (sum(vals)-max(vals)-min(vals)) / (n_obs - (2*clip))
+            vals.append(self.read_raw())
+        reading = self._average(vals, clip)
         if self.PRINTOUT:    
             print("Avg over {} observation(s): {}".format(n_obs, reading))
         return reading
 
+    def _average(self, vals, clip):
+        """
+        Mean of vals, excluding the highest and lowest if clip
+        """
+        total = sum(vals)
+        if clip:
+            total -= max(vals) + min(vals)
+        return total / (len(vals) - (2*clip))
+
+    def capture(self, n, timeout=None):
+        """
+        Read n conversions back to back into preallocated arrays.
+        Returns (values, timestamps): int32 signed counts and float64 time.time() of each conversion.
+        For an HX711Group values has shape (n, number of chips)
+
+        args:
+            n: (int) number of conversions
+            timeout: (float) seconds to wait for each conversion. Defaults to self.TIMEOUT
+        """
+        raw = np.empty((n,) + self._sample_shape(), dtype=np.uint32)
+        timestamps = np.empty(n, dtype=np.float64)
+        for i in range(n):
+            timestamps[i], raw[i] = self._read_conversion(timeout)
+        return to_signed(raw), timestamps
+
+    def _sample_shape(self):
+        """
+        Shape of one conversion's values: () for a single chip
+        """
+        return ()
+
+    def _record_header(self):
+        """
+        Returns (magic, header fields after the sample count, record dtype) of this chip's recordings
+        """
+        return RECORD_MAGIC, b"", RECORD_DTYPE
+
+    def record(self, path, duration, timeout=None, chunk=4096):
+        """
+        Append conversions to a recording file for duration seconds (see RECORD_DTYPE,
+        or group_record_dtype() for an HX711Group: one raw column per chip).
+        The file grows chunk records at a time and is written through a memory map.
+        The sample count in the header is updated after each record, so other
+        processes can follow the recording with read_recording() while it is written.
+        Returns the number of samples recorded
+
+        args:
+            path: (str) recording file. Created if it doesn't exist, appended to otherwise
+            duration: (float) seconds
+            timeout: (float) seconds to wait for each conversion. Defaults to self.TIMEOUT
+            chunk: (int) records added to the file each time it fills
+        """
+        magic, fields, dtype = self._record_header()
+        itemsize = dtype.itemsize
+        header_size = len(magic) + 8 + len(fields)
+        new = (not os.path.exists(path)) or (os.path.getsize(path) < header_size)
+        with open(path, "w+b" if new else "r+b") as f:
+            if new:
+                f.write(magic + struct.pack("<Q", 0) + fields)
+                f.flush()
+            else:
+                assert f.read(len(magic)) == magic, "{} is not a recording from this reader".format(path)
+                f.seek(len(magic) + 8)
+                assert f.read(len(fields)) == fields, "{} was recorded from a different number of chips".format(path)
+            header = np.memmap(f, dtype="<u8", mode="r+", offset=len(magic), shape=(1,))
+            start = count = int(header[0])
+            base = count
+            records = None
+            end = time.monotonic() + duration
+            while time.monotonic() < end:
+                if (records is None) or (count - base == len(records)):
+                    if records is not None:
+                        records.flush()
+                    base = count
+                    f.truncate(header_size + (base + chunk) * itemsize)
+                    records = np.memmap(f, dtype=dtype, mode="r+",
+                                        offset=header_size + base * itemsize, shape=(chunk,))
+                records[count - base] = self._read_conversion(timeout)
+                count += 1
+                header[0] = count  # publish the record
+            if records is not None:
+                records.flush()
+                del records
+            header.flush()
+            del header
+            f.truncate(header_size + count * itemsize)
+        return count - start
+
+    def start_sampler(self, size=1024, filter=None):
+        """
+        Start a background HX711Sampler reading this chip continuously. Returns the sampler.
+        While it runs, read values from the sampler rather than calling get_reading()
+
+        args:
+            size: (int) number of samples kept in the ring buffer
+            filter: see HX711Sampler
+        """
+        return HX711Sampler(self, size, filter).start()
+
     def start_monitoring(self, n_obs=1):
         """
         The main loop to take readings. Optionally averaged over multiple readings for stability
@@ -124,6 +399,253 @@ class HX711(BaseIO):
         while True:
             self.get_reading(n_obs)
 
+
+class HX711Group(HX711):
+    def __init__(self, data_pins=[27,22], clock=17, channel="A", gain=128, printout=True, timeout=1.0, sps=10):
+        """
+        Several HX711s sharing one CLOCK pin, read in parallel. Each clock pulse
+        shifts one bit out of every chip, and the DOUT pins are sampled together
+        with GPIO.input_levels() (one level register read on the mmap backend),
+        so N chips are read with one set of 24 + EXTRA_PULSES pulses.
+
+        The extra pulses reach every chip, so the channel and gain (set with
+        setup_channel_gain()) are shared by the group. They can still be changed
+        between reads to alternate channels; self.setting holds the
+        (channel, gain) the last values were converted with.
+
+        args:
+            data_pins: list(int). BCM pin# of each chip's DOUT
+            clock: (int) BCM pin# of the shared CLOCK
+            channel, gain, printout, timeout, sps: see HX711
+        """
+        assert len(data_pins) > 0
+        self.DATA_PINS = list(data_pins)
+        self.setting = None
+        self._converting = ("A", 128)  # chips power up converting channel A at gain 128
+        super().__init__(data=self.DATA_PINS, clock=clock, channel=channel, gain=gain,
+                         printout=printout, timeout=timeout, sps=sps)
+
+    def setup_pins(self, data=None, clock=None):
+        if data is not None:
+            self.DATA_PINS = list(data)
+        super().setup_pins(self.DATA_PINS, clock)
+
+    def _wait_ready(self, timeout=None):
+        """
+        Wait until every chip has a conversion ready
+        """
+        timeout = self.TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        for pin in self.DATA_PINS:
+            self._wait_low(pin, deadline, timeout)
+
+    def _shift_in(self):
+        """
+        Clock out every chip's conversion. Returns a list of unsigned 24 bit counts,
+        or None if a CLOCK high lasted longer than MAX_CLOCK_HIGH
+        """
+        perf_counter = time.perf_counter
+        longest = 0
+        pins = self.DATA_PINS
+        values = [0] * len(pins)
+        for i in range(24):
+            high_at = perf_counter()
+            GPIO.output(self.CLOCK, GPIO.HIGH)
+            GPIO.output(self.CLOCK, GPIO.LOW)
+            longest = max(longest, perf_counter() - high_at)
+            values = [(value << 1) | bit for value, bit in zip(values, GPIO.input_levels(pins))]
+        # Communicate the selected channel and gain settings
+        for i in range(self.EXTRA_PULSES):
+            high_at = perf_counter()
+            GPIO.output(self.CLOCK, GPIO.HIGH)
+            GPIO.output(self.CLOCK, GPIO.LOW)
+            longest = max(longest, perf_counter() - high_at)
+        self.max_clock_high = max(self.max_clock_high, longest)
+        if longest > self.MAX_CLOCK_HIGH:
+            self._converting = ("A", 128)  # the chips may have reset
+            return None
+        self.setting = self._converting
+        self._converting = (self.CHANNEL, self.GAIN)
+        return values
+
+    def read_raw(self, timeout=None):
+        """
+        Wait until every chip has a conversion ready, then read them all.
+        Returns a list of signed 24 bit ints, one per DATA pin
+
+        args:
+            timeout: (float) seconds. Defaults to self.TIMEOUT
+        """
+        values = self._read_conversion(timeout)[1]
+        return [value - 0x1000000 if value & 0x800000 else value for value in values]  # unsigned to signed
+
+    def get_reading(self, n_obs=5, clip=True):
+        """
+        Returns a list with one reading per chip (each averaged over n_obs conversions)
+
+        args:
+            n_obs: (int) number of readings to average over
+            clip: (bool) if True, removes each chip's highest and lowest values
+        """
+        assert (n_obs - (2*clip) >= 1)
+        rows = [self.read_raw() for i in range(n_obs)]
+        readings = [self._average(vals, clip) for vals in zip(*rows)]
+        if self.PRINTOUT:
+            print("Avg over {} observation(s): {}".format(n_obs, readings))
+        return readings
+
+    def _sample_shape(self):
+        return (len(self.DATA_PINS),)
+
+    def _record_header(self):
+        n_chips = len(self.DATA_PINS)
+        return GROUP_RECORD_MAGIC, struct.pack("<Q", n_chips), group_record_dtype(n_chips)
+
+
+class HX711Sampler():
+    def __init__(self, hx711, size=1024, filter=None):
+        """
+        Reads an HX711 continuously on a background thread into a fixed size ring buffer
+        of raw values and timestamps, so any number of consumers can read the latest
+        samples without triggering a conversion each.
+
+        The sampler thread is the only writer. It fills a slot and then increments
+        self.count, so readers take no lock: they copy the slots below count and
+        discard the copy if the writer has since wrapped round onto them.
+
+        For an HX711Group each sample is a row with one value per chip, and
+        samples(), latest(), mean() and median() return per chip lists.
+
+        args:
+            hx711: (HX711 or HX711Group) chip(s) to read. The sampler owns it while running
+            size: (int) number of samples kept
+            filter: optional filter (see filters.py) updated with every raw sample.
+                    For an HX711Group, a list with one filter per chip.
+                    Its output is kept in self.filtered
+        """
+        assert size > 1
+        self.hx711 = hx711
+        self.SIZE = size
+        self.WIDTH = len(hx711.DATA_PINS) if isinstance(hx711, HX711Group) else 1  # values per sample
+        if (filter is not None) and (self.WIDTH > 1):
+            assert len(filter) == self.WIDTH, "one filter per chip"
+        self.values = array.array("l", [0]) * (size * self.WIDTH)  # raw signed 24 bit readings, row by row
+        self.timestamps = array.array("d", [0.0]) * size  # time.time() of each reading
+        self.count = 0  # total samples written. The newest is at (count-1) % SIZE
+        self.timeouts = 0  # conversions that timed out (chip powered down or disconnected)
+        self.failures = 0  # reads that gave up after MAX_RETRIES bad conversions
+        self.filter = filter
+        self.filtered = None
+        self._new = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                value = self.hx711.read_raw()
+            except TimeoutError:
+                self.timeouts += 1
+                continue
+            except RuntimeError:
+                self.failures += 1
+                continue
+            i = self.count % self.SIZE
+            if self.WIDTH == 1:
+                if self.filter is not None:
+                    self.filtered = self.filter.update(value)
+                self.values[i] = value
+            else:
+                if self.filter is not None:
+                    self.filtered = [f.update(v) for f, v in zip(self.filter, value)]
+                self.values[i*self.WIDTH:(i + 1)*self.WIDTH] = array.array("l", value)
+            self.timestamps[i] = time.time()
+            self.count += 1
+            with self._new:
+                self._new.notify_all()
+
+    def samples(self, n):
+        """
+        Returns (values, timestamps) lists of the last n samples, oldest first.
+        For an HX711Group each value is a list with one reading per chip.
+        Fewer are returned if fewer have been taken (n is capped at SIZE-1)
+
+        args:
+            n: (int) number of samples
+        """
+        while True:
+            count = self.count
+            n_taken = min(n, count, self.SIZE - 1)
+            slots = [(count - n_taken + i) % self.SIZE for i in range(n_taken)]
+            if self.WIDTH == 1:
+                values = [self.values[i] for i in slots]
+            else:
+                values = [self.values[i*self.WIDTH:(i + 1)*self.WIDTH].tolist() for i in slots]
+            timestamps = [self.timestamps[i] for i in slots]
+            # retry if the writer overwrote the oldest slot while it was being copied
+            if self.count - self.SIZE < count - n_taken:
+                return values, timestamps
+
+    def latest(self):
+        """
+        Returns (value, timestamp) of the newest sample, or None before the first one
+        """
+        values, timestamps = self.samples(1)
+        if not values:
+            return None
+        return values[0], timestamps[0]
+
+    def mean(self, n):
+        """
+        Mean of the last n samples (None before the first one). A list per chip for an HX711Group
+        """
+        values = self.samples(n)[0]
+        if not values:
+            return None
+        if self.WIDTH > 1:
+            return [sum(chip) / len(chip) for chip in zip(*values)]
+        return sum(values) / len(values)
+
+    def median(self, n):
+        """
+        Median of the last n samples (None before the first one). A list per chip for an HX711Group
+        """
+        values = self.samples(n)[0]
+        if not values:
+            return None
+        if self.WIDTH > 1:
+            return [statistics.median(chip) for chip in zip(*values)]
+        return statistics.median(values)
+
+    def wait_for_new(self, count=None, timeout=None):
+        """
+        Block until a sample newer than count has been taken. Returns (value, timestamp)
+        of the newest sample, or None on timeout
+
+        args:
+            count: (int) sample count already seen. Defaults to the current count (the next sample)
+            timeout: (float) seconds
+        """
+        count = self.count if count is None else count
+        with self._new:
+            if not self._new.wait_for(lambda: self.count > count, timeout):
+                return None
+        return self.latest()
+
+
 if __name__ == "__main__":
     try:
         hx = HX711(data=27, clock=17, gain=128, printout=True)
@@ -9,19 +9,110 @@ Based on code written by:
 """
 
 
-import RPi.GPIO as GPIO
+import re
+import threading
 import time
+from collections import OrderedDict
 
 if __name__ == "__main__":
     from base import BaseIO
+    from gpio import GPIO
+    from lcdtransport import ParallelTransport
 else:
     from rpigpio.base import BaseIO
+    from rpigpio.gpio import GPIO
+    from rpigpio.lcdtransport import ParallelTransport
+
+class GlyphCache():
+    def __init__(self, lcd):
+        """
+        Maps any number of user defined 5x8 glyphs onto the HD44780's 8 CGRAM slots.
+        Glyphs are uploaded only when not already resident. When all slots are taken,
+        the least recently used glyph that is not on screen, pending in the
+        framebuffer or already used by the text being encoded is evicted.
+
+        args:
+            lcd: (LCD1602)
+        """
+        self.lcd = lcd
+        self.patterns = {}  # name: bytes of 8 row bitmaps
+        self.resident = OrderedDict()  # name: slot, least recently used first
+        self.uploads = 0
+        self.hits = 0
+        self.pinned = set()  # slots used by the text being encoded, which mustn't be evicted
+
+    def define(self, name, rows):
+        """
+        Define (or redefine) a glyph
+
+        args:
+            name: (str)
+            rows: list(int). 8 row bitmaps, 5 bits each
+        """
+        assert len(rows) == 8
+        pattern = bytes(row & 0x1F for row in rows)
+        if self.patterns.get(name) == pattern:
+            return
+        self.patterns[name] = pattern
+        if name in self.resident:
+            # redefined while resident: refresh the CGRAM contents in place
+            self._upload(self.resident[name], pattern)
+
+    def slot(self, name):
+        """
+        Returns the CGRAM slot (= character code 0-7) holding the glyph, uploading it if needed
+        """
+        slot = self.resident.get(name)
+        if slot is not None:
+            self.resident.move_to_end(name)
+            self.hits += 1
+            self.pinned.add(slot)
+            return slot
+        used = set(self.resident.values())
+        free = [s for s in range(8) if s not in used]
+        if free:
+            slot = free[0]
+        else:
+            in_use = self._codes_on_screen() | self.pinned
+            for resident_name, resident_slot in self.resident.items():
+                if resident_slot not in in_use:
+                    slot = resident_slot
+                    del self.resident[resident_name]
+                    break
+            else:
+                raise RuntimeError("All 8 CGRAM glyphs are on screen, cannot load '{}'".format(name))
+        self._upload(slot, self.patterns[name])
+        self.resident[name] = slot
+        self.pinned.add(slot)
+        return slot
+
+    def _codes_on_screen(self):
+        """
+        Returns the set of CGRAM slots displayed or pending in the framebuffer.
+        Codes 8-15 show the same CGRAM glyphs as 0-7
+        """
+        codes = set()
+        for rows in [self.lcd.shadow, self.lcd.frame]:
+            for row in rows:
+                codes.update(code & 0x07 for code in row if code < 16)
+        return codes
+
+    def _upload(self, slot, pattern):
+        lcd = self.lcd
+        # set CGRAM address, then write the 8 rows
+        lcd.transport.write([(0x40 | (slot << 3), lcd.LCD_CMD)] + [(row, lcd.LCD_CHR) for row in pattern])
+        lcd._cursor = None  # the address counter now points into CGRAM
+        self.uploads += 1
+
 
 class LCD1602(BaseIO):
-    def __init__(self, data_pins=[23,24,25,8], rs_pin=14, e_pin=15):
+    GLYPH_NAME = re.compile(r"\{(\w+)\}")
+
+    def __init__(self, data_pins=[23,24,25,8], rs_pin=14, e_pin=15, transport=None, cols=16, rows=2):
         """
-        Class to handle communications with 16x02 LCD displays driven by 
-        the Hitachi HD44780 Controller. Uses 4 bit communication
+        Class to handle communications with 16x02 (or 20x4, 40x2, ...) LCD displays
+        driven by the Hitachi HD44780 Controller. Uses 4 bit communication,
+        over parallel GPIO pins or an I2C backpack (see lcdtransport.py)
     
         The wiring for the LCD is as follows:
         1 : GND
@@ -45,117 +136,220 @@ class LCD1602(BaseIO):
             data_pins: list(int). 4 GPIO pins (BCM) for LCD pins 11-14 (Data Bit 4/5/6/7)
             rs_pin: int. GPIO pin (BCM) for LCD pin 4 (Register Select)
             e_pin: int. GPIO pin (BCM) for LCD pin 6(Enable)
+            transport: (LCDTransport) e.g. PCF8574Transport for an I2C backpack.
+                       Defaults to ParallelTransport(data_pins, rs_pin, e_pin)
+            cols: (int) characters per line (16, 20, 40)
+            rows: (int) number of lines (1, 2, 4)
         """
-        assert len(data_pins) == 4
-        GPIO.setmode(GPIO.BCM)
-        
-        # Define GPIO to LCD mapping
-        self.LCD_RS = rs_pin
-        self.LCD_E  = e_pin
-        self.LCD_D4 = data_pins[0]
-        self.LCD_D5 = data_pins[1]
-        self.LCD_D6 = data_pins[2]
-        self.LCD_D7 = data_pins[3]
-        self.PINS = [rs_pin] + [e_pin] + [data_pins]
+        assert rows in [1, 2, 4]
+        if transport is None:
+            transport = ParallelTransport(data_pins, rs_pin, e_pin)
+        self.transport = transport
  
         # Define some device constants
-        self.LCD_WIDTH = 16    # Maximum characters per line
+        self.LCD_WIDTH = cols    # Maximum characters per line
+        self.LCD_ROWS = rows
         self.LCD_CHR = True
         self.LCD_CMD = False
  
-        self.LCD_LINE_1 = 0x80 # LCD RAM address for the 1st line
-        self.LCD_LINE_2 = 0xC0 # LCD RAM address for the 2nd line
+        # LCD RAM address of each line. Lines 3 and 4 continue lines 1 and 2
+        row_offsets = [0x00, 0x40, cols, 0x40 + cols][:rows]
+        self.LCD_LINES = [0x80 | offset for offset in row_offsets]
+        for i, line in enumerate(self.LCD_LINES):
+            setattr(self, "LCD_LINE_{}".format(i + 1), line)
  
-        # Timing constants
-        self.E_PULSE = 0.0005
-        self.E_DELAY = 0.0005
-      
-        GPIO.setmode(GPIO.BCM)       # Use BCM GPIO numbers
-        for pin in self.PINS:
-            GPIO.setup(pin, GPIO.OUT)
+        # Custom characters
+        self.glyphs = GlyphCache(self)
         
         # Initialise display
         self.lcd_init()
         
     def lcd_init(self):
-        # Initialise display
-        self.lcd_byte(0x33,self.LCD_CMD) # 110011 Initialise
-        self.lcd_byte(0x32,self.LCD_CMD) # 110010 Initialise
-        self.lcd_byte(0x06,self.LCD_CMD) # 000110 Cursor move direction
-        self.lcd_byte(0x0C,self.LCD_CMD) # 001100 Display On,Cursor Off, Blink Off
-        self.lcd_byte(0x28,self.LCD_CMD) # 101000 Data length, number of lines, font size
-        self.lcd_byte(0x01,self.LCD_CMD) # 000001 Clear display
-        time.sleep(self.E_DELAY)        
-        
+        # Initialise display: reset into 4 bit mode by instruction (datasheet figure 24)
+        transport = self.transport
+        time.sleep(transport.T_POWER_ON)
+        transport.write_nibble(0x3, 0.0041)
+        transport.write_nibble(0x3, 0.0001)
+        transport.write_nibble(0x3, transport.T_CMD)
+        transport.write_nibble(0x2, transport.T_CMD)  # 4 bit interface
+        transport.write([
+                (0x28 if self.LCD_ROWS > 1 else 0x20, self.LCD_CMD), # 101000 Data length, number of lines, font size
+                (0x0C, self.LCD_CMD), # 001100 Display On,Cursor Off, Blink Off
+                (0x06, self.LCD_CMD), # 000110 Cursor move direction
+                (0x01, self.LCD_CMD)]) # 000001 Clear display
+        self._reset_frame()
+
     def lcd_byte(self, bits, mode):
         """
-        Send byte to data pins
+        Send byte to the display
         
         args:
             bits: (hex) data
             mode: True  for character
                   False for command
         """
+        self.transport.write([(bits, mode)])
  
-        GPIO.output(self.LCD_RS, mode) # RS
- 
-         # High bits
-        GPIO.output(self.LCD_D4, False)
-        GPIO.output(self.LCD_D5, False)
-        GPIO.output(self.LCD_D6, False)
-        GPIO.output(self.LCD_D7, False)
-        if bits&0x10==0x10:
-            GPIO.output(self.LCD_D4, True)
-        if bits&0x20==0x20:
-            GPIO.output(self.LCD_D5, True)
-        if bits&0x40==0x40:
-            GPIO.output(self.LCD_D6, True)
-        if bits&0x80==0x80:
-            GPIO.output(self.LCD_D7, True)
- 
-        # Toggle 'Enable' pin
-        self.lcd_toggle_enable()
- 
-        # Low bits
-        GPIO.output(self.LCD_D4, False)
-        GPIO.output(self.LCD_D5, False)
-        GPIO.output(self.LCD_D6, False)
-        GPIO.output(self.LCD_D7, False)
-        if bits&0x01==0x01:
-            GPIO.output(self.LCD_D4, True)
-        if bits&0x02==0x02:
-            GPIO.output(self.LCD_D5, True)
-        if bits&0x04==0x04:
-            GPIO.output(self.LCD_D6, True)
-        if bits&0x08==0x08:
-            GPIO.output(self.LCD_D7, True)
- 
-        # Toggle 'Enable' pin
-        self.lcd_toggle_enable()
- 
-    def lcd_toggle_enable(self):
-        # Toggle enable
-        time.sleep(self.E_DELAY)
-        GPIO.output(self.LCD_E, True)
-        time.sleep(self.E_PULSE)
-        GPIO.output(self.LCD_E, False)
-        time.sleep(self.E_DELAY)
- 
+    def _reset_frame(self):
+        """
+        Reset the framebuffer to match a cleared display (all spaces, cursor at the start of line 1).
+        self.frame holds the requested character codes per row,
+        self.shadow the character codes currently on the display.
+        """
+        self.frame = [bytearray(b" " * self.LCD_WIDTH) for line in self.LCD_LINES]
+        self.shadow = [bytearray(b" " * self.LCD_WIDTH) for line in self.LCD_LINES]
+        self._dirty_rows = set()
+        self._cursor = (0, 0)
+
+    def encode(self, text):
+        """
+        Returns the HD44780 character codes for text. In a str, {name} is replaced by
+        the CGRAM code of the glyph defined with define_glyph(name, ...), uploading
+        it if needed. Unknown names are left as is.
+
+        args:
+            text: (str or bytes). bytes are returned unchanged
+        """
+        if not isinstance(text, str):
+            return text
+        if self.glyphs.patterns and ("{" in text):
+            self.glyphs.pinned.clear()
+            try:
+                text = self.GLYPH_NAME.sub(self._glyph_char, text)
+            finally:
+                self.glyphs.pinned.clear()
+        return text.encode("latin-1", "replace")
+
+    def _glyph_char(self, match):
+        name = match.group(1)
+        if name not in self.glyphs.patterns:
+            return match.group(0)
+        return chr(self.glyphs.slot(name))
+
+    def define_glyph(self, name, rows):
+        """
+        Define a custom 5x8 character, usable as {name} in lcd_string()/write(). See GlyphCache
+
+        args:
+            name: (str) glyph name (letters, digits, underscores)
+            rows: list(int). 8 row bitmaps, 5 bits each (bit 4 is the leftmost pixel)
+        """
+        self.glyphs.define(name, rows)
+
+    def write(self, row, col, text):
+        """
+        Write text into the framebuffer. Nothing is sent to the display until flush().
+        Text running past the end of the row is truncated.
+
+        args:
+            row: (int) 0 based row
+            col: (int) 0 based column
+            text: (str or bytes) characters, or HD44780 character codes.
+                  See encode() for inline glyph names
+        """
+        text = self.encode(text)[:max(self.LCD_WIDTH - col, 0)]
+        frame_row = self.frame[row]
+        if frame_row[col:col + len(text)] != text:
+            frame_row[col:col + len(text)] = text
+            self._dirty_rows.add(row)
+
+    def flush(self):
+        """
+        Send the framebuffer cells that differ from the display. The DDRAM address
+        is only set when the next changed cell is not at the display's cursor.
+        Returns the number of characters sent.
+        """
+        if not self._dirty_rows:
+            return 0
+        writes = []
+        n_sent = 0
+        for row in sorted(self._dirty_rows):
+            frame_row = self.frame[row]
+            shadow_row = self.shadow[row]
+            for col in range(self.LCD_WIDTH):
+                code = frame_row[col]
+                if code == shadow_row[col]:
+                    continue
+                if self._cursor != (row, col):
+                    writes.append((self.LCD_LINES[row] + col, self.LCD_CMD))
+                writes.append((code, self.LCD_CHR))
+                shadow_row[col] = code
+                self._cursor = (row, col + 1)
+                n_sent += 1
+        self._dirty_rows.clear()
+        # one transport call, so e.g. I2C can pack the whole update into block writes
+        self.transport.write(writes)
+        return n_sent
+
     def lcd_string(self, message, line):
         """
-        Send string to display
+        Send string to display. Only the characters that changed are sent (see flush())
         
         args:
             message: (str). Single line string to send to the display 
-                    (max 16 characters)
-            line: self.LCD_LINE_1 or self.LCD_LINE_2. Contains LCD RAM address  
+                    (max LCD_WIDTH characters)
+            line: self.LCD_LINE_1, self.LCD_LINE_2, ... Contains LCD RAM address  
+        """
+        message = self.encode(message).ljust(self.LCD_WIDTH, b" ")
+        self.write(self.LCD_LINES.index(line), 0, message)
+        self.flush()
+
+    def start_renderer(self, max_refresh_hz=20):
+        """
+        Start and return an LCDRenderer that owns this display
+
+        args:
+            max_refresh_hz: (float) maximum number of display refreshes per second
         """
-        message = message.ljust(self.LCD_WIDTH," ")
-        # send command        
-        self.lcd_byte(line, self.LCD_CMD)
-        # send characters
-        for i in range(self.LCD_WIDTH):
-            self.lcd_byte(ord(message[i]), self.LCD_CHR)
+        return LCDRenderer(self, max_refresh_hz).start()
+
+    # Pin and timing attributes from before the transports, forwarded to a ParallelTransport
+
+    def _parallel(self, name):
+        if not isinstance(self.transport, ParallelTransport):
+            raise AttributeError("{} is only defined for a parallel GPIO transport".format(name))
+        return self.transport
+
+    @property
+    def LCD_RS(self):
+        return self._parallel("LCD_RS").LCD_RS
+
+    @property
+    def LCD_E(self):
+        return self._parallel("LCD_E").LCD_E
+
+    @property
+    def LCD_D4(self):
+        return self._parallel("LCD_D4").DATA_PINS[0]
+
+    @property
+    def LCD_D5(self):
+        return self._parallel("LCD_D5").DATA_PINS[1]
+
+    @property
+    def LCD_D6(self):
+        return self._parallel("LCD_D6").DATA_PINS[2]
+
+    @property
+    def LCD_D7(self):
+        return self._parallel("LCD_D7").DATA_PINS[3]
+
+    @property
+    def PINS(self):
+        transport = self._parallel("PINS")
+        return [transport.LCD_RS] + [transport.LCD_E] + [transport.DATA_PINS]
+
+    @property
+    def E_PULSE(self):
+        return self._parallel("E_PULSE").E_PULSE
+
+    @property
+    def E_DELAY(self):
+        # The fixed wait between writes is now each write's execution time
+        return self.transport.T_CMD
+
+    def lcd_toggle_enable(self):
+        self._parallel("lcd_toggle_enable").toggle_enable()
 
     def clear_screen(self):
         """
@@ -163,15 +357,101 @@ class LCD1602(BaseIO):
         using its internal function for efficiency
         """
         self.lcd_byte(0x01, self.LCD_CMD)
+        self._reset_frame()
             
     def cleanup(self):
         """
         Sends an instruction for the HD44780 to clear the display
-        using its internal function for efficiency
+        using its internal function for efficiency, then releases the transport
         """
         self.clear_screen()
-        super().cleanup()
+        self.transport.cleanup()
             
+class LCDRenderer():
+    def __init__(self, lcd, max_refresh_hz=20):
+        """
+        Background thread that owns an LCD1602. Callers post line contents without
+        blocking. Posts that arrive before the next refresh are merged, so only the
+        newest content per line is drawn. Once started, write to the display only via post().
+        If drawing raises (e.g. GlyphCache's RuntimeError), the thread stops and the
+        exception is kept in self.error and raised by the next post() or stop().
+
+        args:
+            lcd: (LCD1602) display to draw to
+            max_refresh_hz: (float) maximum number of display refreshes per second
+        """
+        self.lcd = lcd
+        self.MAX_REFRESH_HZ = max_refresh_hz
+        self.frames = 0  # number of refreshes that sent characters to the display
+        self.error = None  # exception that stopped the render thread
+        self.merged = 0  # number of posts superseded before being drawn
+        self._pending = {}  # row: text
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def post(self, row, text):
+        """
+        Queue a line for display. Returns immediately
+
+        args:
+            row: (int) 0 based row
+            text: (str) line contents (padded/truncated to the display width)
+        """
+        if self.error is not None:
+            raise self.error
+        with self._lock:
+            if row in self._pending:
+                self.merged += 1
+            self._pending[row] = text
+            self._wake.set()
+
+    def stop(self, timeout=None):
+        """
+        Draw any pending lines, then stop the render thread
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        try:
+            self._render()
+        except Exception as e:
+            self.error = e
+
+    def _render(self):
+        lcd = self.lcd
+        last_refresh = None
+        while True:
+            self._wake.wait()
+            if last_refresh is not None:
+                # rate limit. Posts arriving meanwhile are merged into this refresh
+                remaining = last_refresh + 1/self.MAX_REFRESH_HZ - time.monotonic()
+                if remaining > 0:
+                    self._stop.wait(remaining)
+            with self._lock:
+                self._wake.clear()
+                pending, self._pending = self._pending, {}
+            for row, text in pending.items():
+                lcd.write(row, 0, lcd.encode(text).ljust(lcd.LCD_WIDTH, b" "))
+            if lcd.flush():
+                self.frames += 1
+            last_refresh = time.monotonic()
+            if self._stop.is_set() and not self._pending:
+                break
+
 if __name__ == '__main__':
     try:
         lcd = LCD1602(data_pins=[6,13,19,26], rs_pin=11, e_pin=5)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+"""
+Transports carrying HD44780 writes from LCD1602 to the display:
+6 pin parallel GPIO, or a PCF8574 I2C backpack
+"""
+
+
+import math
+import time
+
+if __name__ == "lcdtransport":
+    from gpio import GPIO
+else:
+    from rpigpio.gpio import GPIO
+
+
+class LCDTransport():
+    """
+    Base class for LCD1602 transports. Subclasses implement write_nibble() and write()
+    """
+    LCD_CHR = True
+    LCD_CMD = False
+
+    # Timing constants (seconds), from the HD44780 datasheet at 270kHz
+    T_CMD = 0.000037       # execution time of most commands
+    T_CHR = 0.000041       # character write, including the address counter update
+    T_HOME = 0.00152       # clear display (0x01) and return home (0x02)
+    T_POWER_ON = 0.04      # wait after power on before initialising
+
+    def write_delay(self, bits, mode):
+        """
+        Returns the execution time (seconds) of a write
+
+        args:
+            bits: (int) data
+            mode: True for character, False for command
+        """
+        if mode == self.LCD_CHR:
+            return self.T_CHR
+        if bits in [0x01, 0x02, 0x03]:
+            return self.T_HOME
+        return self.T_CMD
+
+    def write_nibble(self, nibble, delay):
+        """
+        Send a single command nibble (used while initialising in 8 bit mode)
+
+        args:
+            nibble: (int) 4 bit value
+            delay: (float) seconds to wait before the next write
+        """
+        raise NotImplementedError
+
+    def write(self, writes):
+        """
+        Send a sequence of bytes in order, respecting each one's execution time
+
+        args:
+            writes: list((int, bool)). (bits, mode) pairs
+        """
+        raise NotImplementedError
+
+    def cleanup(self):
+        """
+        Release the transport's pins or bus
+        """
+        pass
+
+
+class ParallelTransport(LCDTransport):
+    def __init__(self, data_pins=[23,24,25,8], rs_pin=14, e_pin=15):
+        """
+        4 bit parallel interface on GPIO pins. RS and each nibble are written with
+        one multi-pin output, and each write only waits for the previous one's execution time.
+
+        args:
+            data_pins: list(int). 4 GPIO pins (BCM) for LCD pins 11-14 (Data Bit 4/5/6/7)
+            rs_pin: int. GPIO pin (BCM) for LCD pin 4 (Register Select)
+            e_pin: int. GPIO pin (BCM) for LCD pin 6(Enable)
+        """
+        assert len(data_pins) == 4
+        self.LCD_RS = rs_pin
+        self.LCD_E = e_pin
+        self.DATA_PINS = list(data_pins)
+        self.WRITE_PINS = [rs_pin] + self.DATA_PINS
+        self.E_PULSE = 0.00000045  # minimum enable pulse width
+        self._ready_at = 0         # time.perf_counter() when the controller can accept the next write
+
+        # (RS, D4, D5, D6, D7) levels for the high and low nibble of every byte, by mode
+        self.NIBBLE_TABLE = {
+                mode: [(
+                    (mode, (bits>>4)&1, (bits>>5)&1, (bits>>6)&1, (bits>>7)&1),
+                    (mode, bits&1, (bits>>1)&1, (bits>>2)&1, (bits>>3)&1)) for bits in range(256)]
+                for mode in [self.LCD_CHR, self.LCD_CMD]}
+
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup([rs_pin, e_pin] + self.DATA_PINS, GPIO.OUT)
+
+    def _wait(self, delay):
+        """
+        Mark the controller busy for delay seconds from now
+        """
+        self._ready_at = time.perf_counter() + delay
+
+    def _wait_ready(self):
+        """
+        Block until the previous write has executed. Sleeps for long waits,
+        and spins for the short ones that time.sleep() can't resolve
+        """
+        remaining = self._ready_at - time.perf_counter()
+        if remaining > 0.0005:
+            time.sleep(remaining - 0.0002)
+        while time.perf_counter() < self._ready_at:
+            pass
+
+    def toggle_enable(self):
+        # Toggle enable. Data is latched on the falling edge
+        GPIO.output(self.LCD_E, True)
+        end = time.perf_counter() + self.E_PULSE
+        while time.perf_counter() < end:
+            pass
+        GPIO.output(self.LCD_E, False)
+
+    def write_nibble(self, nibble, delay):
+        self._wait_ready()
+        GPIO.output(self.WRITE_PINS, self.NIBBLE_TABLE[self.LCD_CMD][nibble][1])
+        self.toggle_enable()
+        self._wait(delay)
+
+    def write(self, writes):
+        table = self.NIBBLE_TABLE
+        for bits, mode in writes:
+            high, low = table[mode][bits]
+            self._wait_ready()
+            GPIO.output(self.WRITE_PINS, high)
+            self.toggle_enable()
+            GPIO.output(self.WRITE_PINS, low)
+            self.toggle_enable()
+            self._wait(self.write_delay(bits, mode))
+
+    def cleanup(self):
+        GPIO.cleanup(self.WRITE_PINS + [self.LCD_E])
+
+
+class PCF8574Transport(LCDTransport):
+    # PCF8574 port bits on the common backpack wiring. D4-D7 are on P4-P7
+    RS = 0x01
+    RW = 0x02
+    E = 0x04
+    BACKLIGHT = 0x08
+    BLOCK_SIZE = 32  # maximum data bytes per SMBus block write (plus the command byte)
+
+    def __init__(self, bus=1, address=0x27, backlight=True, bus_hz=100000):
+        """
+        I2C transport through a PCF8574 backpack. Every nibble becomes two port
+        writes (E high, then E low), and a whole write() sequence is packed into
+        as few SMBus block writes as possible. Each port write takes 9 bit times
+        (~90us at 100kHz). Where the two port writes before the next byte is latched
+        don't cover a write's execution time (e.g. at 1MHz), idle port writes are
+        added after it. Clear/home end the block and are waited for with a sleep.
+
+        args:
+            bus: (int or SMBus-like object). I2C bus number (opened with smbus2/smbus),
+                 or an object with write_i2c_block_data() and write_byte() (e.g. FakeSMBus)
+            address: (int) I2C address of the backpack
+            backlight: (bool) backlight on
+            bus_hz: (int) I2C clock rate the bus runs at
+        """
+        self.BYTE_TIME = 9 / bus_hz  # seconds per port write (8 data bits and the ack)
+        # idle port writes to add after a byte, by execution time. The next byte is
+        # latched on the E falling edge 2 port writes after this one's
+        self.PADDING = {delay: max(math.ceil(delay / self.BYTE_TIME) - 2, 0) for delay in [self.T_CMD, self.T_CHR]}
+        self._owns_bus = isinstance(bus, int)
+        if self._owns_bus:
+            try:
+                from smbus2 import SMBus
+            except ImportError:
+                from smbus import SMBus
+            bus = SMBus(bus)
+        self.bus = bus
+        self.ADDRESS = address
+        self.backlight = backlight
+
+    def set_backlight(self, on):
+        self.backlight = on
+        self.bus.write_byte(self.ADDRESS, self.BACKLIGHT if on else 0)
+
+    def _nibble_bytes(self, nibble, mode):
+        port = (nibble << 4) | (self.BACKLIGHT if self.backlight else 0) | (self.RS if mode else 0)
+        return [port | self.E, port]
+
+    def _send(self, data):
+        """
+        Write port bytes to the backpack in as few block writes as possible
+        """
+        for i in range(0, len(data), self.BLOCK_SIZE + 1):
+            chunk = data[i:i + self.BLOCK_SIZE + 1]
+            if len(chunk) == 1:
+                self.bus.write_byte(self.ADDRESS, chunk[0])
+            else:
+                self.bus.write_i2c_block_data(self.ADDRESS, chunk[0], chunk[1:])
+
+    def write_nibble(self, nibble, delay):
+        self._send(self._nibble_bytes(nibble, self.LCD_CMD))
+        time.sleep(delay)
+
+    def write(self, writes):
+        data = []
+        for bits, mode in writes:
+            data += self._nibble_bytes(bits >> 4, mode)
+            data += self._nibble_bytes(bits & 0x0F, mode)
+            delay = self.write_delay(bits, mode)
+            if delay > self.T_CHR:
+                # clear/home: send what we have and wait for it to execute
+                self._send(data)
+                data = []
+                time.sleep(delay)
+            elif self.PADDING[delay]:
+                data += [data[-1]] * self.PADDING[delay]  # rewriting the port changes nothing
+        if data:
+            self._send(data)
+
+    def cleanup(self):
+        if self._owns_bus:
+            self.bus.close()
+
+
+class FakeSMBus():
+    def __init__(self):
+        """
+        Stand-in for smbus2.SMBus that records writes, for use with PCF8574Transport off the Pi.
+        self.transactions holds (address, list(port bytes)) per I2C transaction.
+        """
+        self.transactions = []
+
+    def write_byte(self, address, value):
+        self.transactions.append((address, [value]))
+
+    def write_i2c_block_data(self, address, register, data):
+        assert len(data) <= 32
+        self.transactions.append((address, [register] + list(data)))
+
+    def decode(self):
+        """
+        Returns the (bits, mode) writes latched by the display, reassembled from
+        the nibbles present on D4-D7 at each E falling edge. Assumes 4 bit mode throughout.
+        """
+        nibbles = []
+        last = 0
+        for address, data in self.transactions:
+            for port in data:
+                if (last & PCF8574Transport.E) and not (port & PCF8574Transport.E):
+                    nibbles.append((last >> 4, bool(last & PCF8574Transport.RS)))
+                last = port
+        return [((high << 4) | low, mode) for (high, mode), (low, _) in zip(nibbles[0::2], nibbles[1::2])]
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+"""
+Class to coordinate linear moves across several stepper motors
+"""
+
+
+import time
+
+if __name__ == "__main__":
+    from base import BaseIO
+    from gpio import GPIO
+    from stepper import Stepper
+else:
+    from rpigpio.base import BaseIO
+    from rpigpio.gpio import GPIO
+    from rpigpio.stepper import Stepper
+
+
+class MultiStepper(BaseIO):
+    def __init__(self, steppers):
+        """
+        Runs linear moves across several Stepper instances from one shared timing loop.
+        Steps are distributed Bresenham-style over the axis with the most steps (the
+        dominant axis), so all axes start and finish together. The dominant axis'
+        ramp sets the pace, and the STEP pins of every axis due on a tick are
+        pulsed with a single GPIO.output() call.
+
+        args:
+            steppers: list(Stepper). One Stepper per axis
+        """
+        assert len(steppers) > 0
+        self.steppers = list(steppers)
+
+    def move(self, deltas, rpm=60, use_ramp=True, stream=False):
+        """
+        Linear move of all axes. Returns the number of dominant axis steps taken.
+
+        args:
+            deltas: list(int). Signed number of steps per axis (positive for direction 1)
+            rpm: (float) target rpm of the dominant axis
+            use_ramp: (bool) if True, applies the dominant axis' ramp
+            stream: (bool) if True, generates the ramp step by step. See Stepper.step()
+        """
+        assert len(deltas) == len(self.steppers)
+        counts = [abs(delta) for delta in deltas]
+        n_steps = max(counts)
+        if n_steps == 0:
+            return 0
+        dominant = counts.index(n_steps)
+        step_pauses = self.steppers[dominant]._step_pauses(n_steps, rpm, use_ramp, stream)
+
+        # Bresenham error terms for the non-dominant moving axes
+        axes = [i for i in range(len(counts)) if (counts[i] > 0) and (i != dominant)]
+        step_pins = [self.steppers[i].STEP for i in axes]
+        axis_counts = [counts[i] for i in axes]
+        errors = [n_steps // 2] * len(axes)
+        dominant_pin = self.steppers[dominant].STEP
+
+        for i in [dominant] + axes:
+            stepper = self.steppers[i]
+            if GPIO.input(stepper.SLEEP) == GPIO.LOW:
+                stepper.wake()
+        GPIO.output(
+                [self.steppers[i].DIR for i in [dominant] + axes],
+                [int(deltas[i] > 0) for i in [dominant] + axes])
+
+        timestamp = time.time()
+        for step_pause in step_pauses:
+            pins = [dominant_pin]
+            for j in range(len(axes)):
+                errors[j] -= axis_counts[j]
+                if errors[j] < 0:
+                    errors[j] += n_steps
+                    pins.append(step_pins[j])
+            time.sleep(max(step_pause - (time.time()-timestamp), 0))
+            GPIO.output(pins, GPIO.HIGH)
+            GPIO.output(pins, GPIO.LOW)
+            timestamp = time.time()
+        return n_steps
+
+    def sleep(self):
+        for stepper in self.steppers:
+            stepper.sleep()
+
+    def wake(self):
+        for stepper in self.steppers:
+            stepper.wake()
+
+if __name__ == "__main__":
+    try:
+        x_axis = Stepper(dir_pin=8, step_pin=7, sleep_pin=25, ms0_pin=21, ms1_pin=20, ms2_pin=16)
+        y_axis = Stepper(dir_pin=24, step_pin=23, sleep_pin=18, ms0_pin=5, ms1_pin=6, ms2_pin=13)
+        axes = MultiStepper([x_axis, y_axis])
+        for sign in [1, -1]:
+            start = time.time()
+            axes.move([sign*400, sign*150], rpm=120)
+            print("Move: {} time: {}s".format(sign, time.time() - start))
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        axes.sleep()
+        GPIO.cleanup()
@@ -5,16 +5,37 @@ Class to handle rotary encoder inputs
 """
 
 
-import RPi.GPIO as GPIO
+import asyncio
+import collections
+import threading
 import time
+import warnings
 
 if __name__ == "__main__":
     from base import BaseIO
+    from gpio import GPIO
+    from timers import timer_queue
 else:
     from rpigpio.base import BaseIO
+    from rpigpio.gpio import GPIO
+    from rpigpio.timers import timer_queue
+
+# kind is "rotate" (value: signed counts), "press", "long_press" or "double_click"
+# (value: press duration in seconds)
+RotaryEvent = collections.namedtuple("RotaryEvent", ["kind", "value", "timestamp"])
 
 class RotaryEncoder(BaseIO):
-    def __init__(self, clk=22, dt=27, button=17, counter=0, long_press_secs=1.0, debounce_n=2):
+    # Count change for each (previous state << 2) | new state, where state = (CLK << 1) | DT.
+    # CLK leading DT is positive. None marks an invalid transition (both pins changed)
+    TRANSITIONS = (
+            0, -1, 1, None,
+            1, 0, None, -1,
+            -1, None, 0, 1,
+            None, 1, -1, 0)
+
+    def __init__(self, clk=22, dt=27, button=17, counter=0, long_press_secs=1.0, debounce_n=None, resolution=1,
+                 queue_size=64, acceleration=0, max_multiplier=10, double_click_secs=0,
+                 button_debounce_secs=0.01, dispatcher=None):
         """
         Class to handle rotary encoder inputs, and integral push button switch.
         
@@ -24,8 +45,27 @@ class RotaryEncoder(BaseIO):
             button: (int) GPIO pin (BCM) for the encoder SW pin
             counter: (int) Keeps track of movements
             long_button_press: (float) Definition (in seconds) of a long button press
-            debounce_n: (int) number of identical readings before rotation pulse is accepted
+            debounce_n: deprecated and ignored. The transition table cancels out contact bounce
+            resolution: (int) counts per detent (one full quadrature cycle): 1, 2 or 4
+            queue_size: (int) maximum events held in self.events. The oldest is dropped when full
+            acceleration: (float) 0 disables. Otherwise each count is multiplied by
+                          1 + acceleration * speed, where speed (counts/sec) comes from
+                          the time since the previous count
+            max_multiplier: (int) cap on the acceleration multiplier
+            double_click_secs: (float) a second click within this time of the first is a
+                               double_click. 0 disables double clicks, so presses are reported
+                               on release instead of after this wait
+            button_debounce_secs: (float) time the button level must be stable for
+            dispatcher: optional EdgeDispatcher to receive edges from, instead of GPIO callbacks.
+                        The encoder then decodes the levels recorded with each edge, in order
+
+        Events can be consumed without polling:
+            for event in encoder: ...          (blocking)
+            async for event in encoder: ...    (asyncio)
         """
+        if debounce_n is not None:
+            warnings.warn("RotaryEncoder debounce_n is ignored: contact bounce cancels out in the "
+                          "transition table", DeprecationWarning, stacklevel=2)
         GPIO.setmode(GPIO.BCM)
         
         # define pin locations (BCM)
@@ -42,86 +82,222 @@ class RotaryEncoder(BaseIO):
         # Define button state
         self.BUTTON_LONG_PRESS = 0
         self.BUTTON_LAST_PRESS = time.time()
+        self.DOUBLE_CLICK_SECS = double_click_secs
+        self.BUTTON_DEBOUNCE_SECS = button_debounce_secs
+        self._button_lock = threading.Lock()
+        self._button_pressed = False
+        self._button_edge_time = None  # time of the first edge since the level was last settled
+        self._press_time = None
+        self._long_reported = False
+        self._settle_timer = None
+        self._long_press_timer = None
+        self._click_timer = None
+        self._click_time = None  # release time of a click waiting for a possible second click
         
         # Define rotation state/counter
-        self.DEBOUNCE_N = debounce_n
-        self.DEBOUNCE_COUNT = 0
-        self.LAST_CLK = GPIO.input(self.CLK)
-        self.LAST_DT = GPIO.input(self.DT)
-        
-        # Add button callback
-        GPIO.add_event_detect(self.BUTTON, GPIO.FALLING, callback=self.button_press)
+        assert resolution in [1, 2, 4]
+        self.RESOLUTION = resolution
+        self.EDGES_PER_COUNT = 4 // resolution
+        self.INVALID_TRANSITIONS = 0
+        clk, dt = GPIO.input_levels([self.CLK, self.DT])
+        self._state = (clk << 1) | dt
+        self._edges = 0  # valid transitions since the last count
+        self.ACCELERATION = acceleration
+        self.MAX_MULTIPLIER = max_multiplier
+        self._last_count_time = None
+
+        # Event queue. Consecutive rotations not yet consumed are merged into one event
+        self.events = collections.deque(maxlen=queue_size)
+        self.DROPPED_EVENTS = 0
+        self._event_ready = threading.Condition()
+        self._async_waiters = []  # (loop, asyncio.Event) of waiting async iterators
         
-        # add callback to both the CLK and DT pins
-        # *** note: for some reason most tutorials only add callbacks to one pin. No idea why.
-        GPIO.add_event_detect(self.CLK, GPIO.RISING, callback=self.decode_step)
-        GPIO.add_event_detect(self.DT, GPIO.RISING, callback=self.decode_step)
+        self.dispatcher = dispatcher
+        if dispatcher is not None:
+            # the rotation handlers run ahead of the button's when the workers are busy
+            dispatcher.add(self.BUTTON, GPIO.BOTH, self.button_press, priority=1)
+            dispatcher.add([self.CLK, self.DT], GPIO.BOTH, self.decode_step)
+        else:
+            # Add button callback
+            GPIO.add_event_detect(self.BUTTON, GPIO.BOTH, callback=self.button_press)
+
+            # add callback to both edges of both the CLK and DT pins
+            GPIO.add_event_detect(self.CLK, GPIO.BOTH, callback=self.decode_step)
+            GPIO.add_event_detect(self.DT, GPIO.BOTH, callback=self.decode_step)
         
-    def decode_step(self, channel):
+    def decode_step(self, channel, level=None, timestamp=None):
         """
-        Catches self.CLK or self.DT pins rising
-        First conduct debouncing.
-        Then return -1, 0, or +1 depending on last movement.
+        Catches edges on the self.CLK and self.DT pins.
+        Looks up the transition from the previous (CLK, DT) state in TRANSITIONS.
+        Contact bounce only moves back and forth between neighbouring states, so it
+        cancels out. Transitions that skip a state are counted in self.INVALID_TRANSITIONS.
+        Return -1, 0, or +1 once EDGES_PER_COUNT transitions have accumulated.
         Also increments self.COUNTER
+
+        args:
+            channel: pin with the edge
+            level: (int) level recorded with the edge (from EdgeDispatcher). If None both pins are read
+            timestamp: (float) time of the edge. Defaults to now
         """
-        clk = GPIO.input(self.CLK)
-        dt = GPIO.input(self.DT)
-        
-        # The first few pulses are assumed to need debouncing
-        if self.DEBOUNCE_COUNT < self.DEBOUNCE_N:
-            direction = 0
-            self.DEBOUNCE_COUNT += 1
-            return None
+        if level is None:
+            clk, dt = GPIO.input_levels([self.CLK, self.DT])
+            state = (clk << 1) | dt
+        elif channel == self.CLK:
+            state = (level << 1) | (self._state & 1)
         else:
-            self.DEBOUNCE_COUNT = 0
-            if channel == self.CLK:  # CLK pin event
-                # movement logic
-                if dt != clk:
-                    direction = 1
-                else:
-                    direction = -1
-            else:  # DT pin event
-                if dt == clk:
-                    direction = 1
-                else:
-                    direction = -1
-            
-        self.COUNTER += direction  
+            state = (self._state & 2) | level
+        move = self.TRANSITIONS[(self._state << 2) | state]
+        self._state = state
+        if move is None:
+            self.INVALID_TRANSITIONS += 1
+            return 0
+        self._edges += move
+        if self._edges >= self.EDGES_PER_COUNT:
+            direction = 1
+        elif self._edges <= -self.EDGES_PER_COUNT:
+            direction = -1
+        else:
+            return 0
+        self._edges -= direction * self.EDGES_PER_COUNT
+        now = time.time() if timestamp is None else timestamp
+        if self.ACCELERATION and (self._last_count_time is not None):
+            speed = 1 / max(now - self._last_count_time, 0.000001)
+            direction *= min(int(1 + self.ACCELERATION * speed), self.MAX_MULTIPLIER)
+        self._last_count_time = now
+        self.COUNTER += direction
+        self._post("rotate", direction, now)
         return direction
-    
-    def button_press(self, channel):
+
+    def _post(self, kind, value, timestamp):
+        """
+        Queue an event and wake anything waiting for one
+        """
+        with self._event_ready:
+            events = self.events
+            if kind == "rotate" and events and events[-1].kind == "rotate":
+                value += events.pop().value
+                if not value:
+                    return
+            elif len(events) == events.maxlen:
+                self.DROPPED_EVENTS += 1
+            events.append(RotaryEvent(kind, value, timestamp))
+            self._event_ready.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            if loop.is_closed():
+                continue
+            try:
+                loop.call_soon_threadsafe(waiter.set)
+            except RuntimeError:  # loop closed since the check
+                pass
+
+    def get_event(self, timeout=None):
+        """
+        Returns the oldest queued RotaryEvent, waiting up to timeout seconds (None: forever)
+        for one. Returns None on timeout
         """
-        Callback for button click, and support for long_clicks.
+        with self._event_ready:
+            if not self._event_ready.wait_for(lambda: self.events, timeout):
+                return None
+            return self.events.popleft()
+
+    def __iter__(self):
+        while True:
+            yield self.get_event()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._event_ready:
+                if self.events:
+                    return self.events.popleft()
+                waiter = asyncio.Event()
+                entry = (loop, waiter)
+                self._async_waiters.append(entry)
+            try:
+                await waiter.wait()
+            finally:
+                # not woken (e.g. cancelled by a timeout): don't leave the waiter behind
+                with self._event_ready:
+                    if entry in self._async_waiters:
+                        self._async_waiters.remove(entry)
+
+    def button_press(self, channel, level=None, timestamp=None):
+        """
+        Callback for button edges. Only timestamps the edge and (re)schedules a check
+        of the level once it has been stable for BUTTON_DEBOUNCE_SECS, on the shared
+        timer queue, so it returns immediately.
+        Press, long press and double click are worked out from the settled edges' timestamps.
         Populates self.BUTTON_LAST_PRESS with a timestamp,
         and self.BUTTON_LONG_PRESS with a boolean.
-        Leaves the interpretation of these to domain specific use cases
         """
-        time_0 = time.time()
-        time_1 = time_0
-        while (GPIO.input(channel) == 0) \
-                & ((time_1-time_0) < self.LONG_PRESS_SECS):
-            time_1 = time.time()
-        self.BUTTON_LAST_PRESS = time_1
-        if (time_1 - time_0) > self.LONG_PRESS_SECS:
-            self.BUTTON_LONG_PRESS = True
-        else:
+        now = time.time() if timestamp is None else timestamp
+        with self._button_lock:
+            if self._button_edge_time is None:
+                self._button_edge_time = now
+            if self._settle_timer is not None:
+                self._settle_timer.cancel()
+            self._settle_timer = timer_queue.schedule(self.BUTTON_DEBOUNCE_SECS, self._button_settled)
+
+    def _button_settled(self):
+        pressed = GPIO.input(self.BUTTON) == 0
+        with self._button_lock:
+            edge_time = self._button_edge_time
+            self._button_edge_time = None
+            self._settle_timer = None
+            if (edge_time is None) or (pressed == self._button_pressed):
+                return
+            self._button_pressed = pressed
+            if pressed:
+                self._press_time = edge_time
+                self._long_reported = False
+                self._long_press_timer = timer_queue.schedule(
+                        max(edge_time + self.LONG_PRESS_SECS - time.time(), 0), self._long_press, edge_time)
+                return
+            if self._long_press_timer is not None:
+                self._long_press_timer.cancel()
+                self._long_press_timer = None
+            if self._long_reported:
+                return
+            duration = edge_time - self._press_time
+            self.BUTTON_LAST_PRESS = edge_time
             self.BUTTON_LONG_PRESS = False
-                
+            if not self.DOUBLE_CLICK_SECS:
+                self._post("press", duration, edge_time)
+            elif self._click_time is not None:
+                self._click_timer.cancel()
+                self._click_time = None
+                self._post("double_click", duration, edge_time)
+            else:
+                self._click_time = edge_time
+                self._click_timer = timer_queue.schedule(self.DOUBLE_CLICK_SECS, self._click, duration, edge_time)
+
+    def _long_press(self, press_time):
+        with self._button_lock:
+            if (not self._button_pressed) or (press_time != self._press_time):
+                return  # released (or pressed again) before the timer ran
+            self._long_press_timer = None
+            self._long_reported = True
+            self.BUTTON_LAST_PRESS = self._press_time + self.LONG_PRESS_SECS
+            self.BUTTON_LONG_PRESS = True
+            self._post("long_press", self.LONG_PRESS_SECS, self.BUTTON_LAST_PRESS)
+
+    def _click(self, duration, timestamp):
+        with self._button_lock:
+            if self._click_time != timestamp:
+                return  # became a double click
+            self._click_time = None
+            self._post("press", duration, timestamp)
+
 
 if __name__ == "__main__":
     try:
-        rot = RotaryEncoder(clk=18, dt=15, button=14, counter=0, long_press_secs=1.0, debounce_n=2)
-        counter = rot.COUNTER
-        button = rot.BUTTON_LAST_PRESS
-        print("{}, {}".format(counter, button))
-        while True:
-            if (rot.COUNTER != counter):
-                counter = rot.COUNTER
-                print("COUNTER: {}".format(counter))
-            elif (rot.BUTTON_LAST_PRESS != button):
-                button = rot.BUTTON_LAST_PRESS
-                button_ls = rot.BUTTON_LONG_PRESS
-                print("Button (Long: {}): {}".format(button, bool(button_ls)))
+        rot = RotaryEncoder(clk=18, dt=15, button=14, counter=0, long_press_secs=1.0, resolution=1)
+        for event in rot:
+            print("{}: {} (COUNTER: {})".format(event.kind, event.value, rot.COUNTER))
     except:
         pass
     finally:
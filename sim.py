@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+
+"""
+Deterministic simulated GPIO backend with a virtual clock.
+
+Select it with RPIGPIO_BACKEND=sim (or rpigpio.set_backend("sim")) to run the device
+classes without a Pi. time.sleep() advances the virtual clock instantly, scripted
+input waveforms are applied as the clock passes them, and every output transition
+is logged.
+"""
+
+
+import heapq
+import itertools
+import threading
+import time
+
+if __name__ == "sim":
+    from gpio import GPIOBackend
+    from timers import timer_queue
+else:
+    from rpigpio.gpio import GPIOBackend
+    from rpigpio.timers import timer_queue
+
+
+class VirtualClock():
+    def __init__(self, start=0.0, tick=0.000001):
+        """
+        Virtual monotonic clock. sleep() advances it instantly. Each time() read (and each
+        SimGPIO.input()) advances it by tick, so busy-wait loops still make progress.
+
+        args:
+            start: (float) initial time in seconds
+            tick: (float) seconds added per clock read
+        """
+        self.now = start
+        self.tick = tick
+        self.listeners = []  # funcs called with the new time whenever the clock advances
+        self._lock = threading.RLock()
+        self._real = None
+
+    def advance(self, secs):
+        with self._lock:
+            target = self.now + max(secs, 0)
+            # listeners may step self.now forward to events on the way to target
+            for listener in self.listeners:
+                listener(target)
+            self.now = max(self.now, target)
+            return self.now
+
+    def time(self):
+        return self.advance(self.tick)
+
+    def sleep(self, secs):
+        self.advance(secs)
+
+    def install(self):
+        """
+        Patch time.time/monotonic/perf_counter/sleep to use this clock.
+        Note that modules which imported these functions by name (e.g. threading) keep real time.
+        """
+        if self._real is None:
+            self._real = (time.time, time.monotonic, time.perf_counter, time.sleep)
+            time.time = self.time
+            time.monotonic = self.time
+            time.perf_counter = self.time
+            time.sleep = self.sleep
+
+    def uninstall(self):
+        if self._real is not None:
+            time.time, time.monotonic, time.perf_counter, time.sleep = self._real
+            self._real = None
+
+
+class SimGPIO(GPIOBackend):
+    def __init__(self, clock=None, install_clock=True):
+        """
+        Simulated GPIO backend.
+
+        args:
+            clock: (VirtualClock) defaults to a new VirtualClock
+            install_clock: (bool) if True, patch the time module to use the clock,
+                           and run the shared timer queue's calls from the clock too,
+                           once set_backend() activates this backend
+        """
+        self.clock = clock if clock is not None else VirtualClock()
+        self.clock.listeners.append(self._run_until)
+        self.install_clock = install_clock
+        self.mode = None
+        self.directions = {}
+        self.levels = {}
+        self.log = []  # (time, channel, level) for every output transition
+        self._events = {}  # channel: [edge, callback, bouncetime_secs, last_event_time, detected]
+        self._output_watchers = {}  # channel: [func(level)]
+        self._edge_waits = {}  # channel: [edge, seen] for wait_for_edge()
+        self._schedule = []  # heap of (time, seq, func)
+        self._seq = itertools.count()
+        self._running = False
+
+    # --- scheduling ---
+
+    def schedule(self, at, func):
+        """
+        Call func() once the clock reaches at (seconds)
+        """
+        with self.clock._lock:
+            heapq.heappush(self._schedule, (at, next(self._seq), func))
+
+    def now(self):
+        """
+        Current virtual time, without advancing the clock
+        """
+        return self.clock.now
+
+    def _run_until(self, now):
+        if self._running:
+            return
+        self._running = True
+        try:
+            while self._schedule and self._schedule[0][0] <= now:
+                at, _, func = heapq.heappop(self._schedule)
+                self.clock.now = max(self.clock.now, at)  # run func at its scheduled time
+                func()
+        finally:
+            self._running = False
+
+    # --- RPi.GPIO API ---
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def _channel_list(self, channel):
+        if isinstance(channel, (list, tuple)):
+            return [c for sub in channel for c in self._channel_list(sub)]
+        return [channel]
+
+    def setup(self, channel, direction, pull_up_down=GPIOBackend.PUD_OFF, initial=None):
+        for pin in self._channel_list(channel):
+            self.directions[pin] = direction
+            if direction == self.OUT:
+                self.levels[pin] = int(bool(initial)) if initial is not None else 0
+            elif pin not in self.levels:
+                self.levels[pin] = int(pull_up_down == self.PUD_UP)
+
+    def output(self, channel, value):
+        if isinstance(channel, (list, tuple)):
+            if not isinstance(value, (list, tuple)):
+                value = [value] * len(channel)
+            for pin, level in zip(channel, value):
+                self._output(pin, level)
+        else:
+            self._output(channel, value)
+
+    def _output(self, channel, level):
+        level = int(bool(level))
+        if self.levels.get(channel) == level:
+            return
+        self.levels[channel] = level
+        self.log.append((self.clock.now, channel, level))
+        for func in self._output_watchers.get(channel, []):
+            func(level)
+
+    def input(self, channel):
+        # each read costs a clock tick, so busy-polling loops see scheduled inputs
+        self.clock.advance(self.clock.tick)
+        return self.levels.get(channel, 0)
+
+    def input_levels(self, channels):
+        self.clock.advance(self.clock.tick)
+        return [self.levels.get(channel, 0) for channel in channels]
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        self._events[channel] = [edge, callback, (bouncetime or 0) / 1000, None, False]
+
+    def add_event_callback(self, channel, callback):
+        self._events[channel][1] = callback
+
+    def remove_event_detect(self, channel):
+        self._events.pop(channel, None)
+
+    def event_detected(self, channel):
+        event = self._events.get(channel)
+        if (event is None) or (not event[4]):
+            return False
+        event[4] = False
+        return True
+
+    def wait_for_edge(self, channel, edge, bouncetime=None, timeout=None):
+        """
+        Advances the clock from one scheduled event to the next until the edge.
+        Returns channel, or None after timeout (ms), or if nothing left is scheduled
+        """
+        deadline = None if timeout is None else self.clock.now + timeout / 1000
+        wait = self._edge_waits[channel] = [edge, False]
+        try:
+            while not wait[1]:
+                if (not self._schedule) or ((deadline is not None) and (self._schedule[0][0] > deadline)):
+                    if deadline is not None:
+                        self.clock.advance(deadline - self.clock.now)
+                    return None
+                self.clock.advance(self._schedule[0][0] - self.clock.now)
+            return channel
+        finally:
+            self._edge_waits.pop(channel, None)
+
+    def cleanup(self, channel=None):
+        pins = self._channel_list(channel) if channel is not None else list(self.directions)
+        for pin in pins:
+            self._events.pop(pin, None)
+            self._output_watchers.pop(pin, None)
+            self.directions.pop(pin, None)
+
+    def activate(self):
+        # Installed here rather than in __init__, so closing a replaced sim backend
+        # can't restore real time over this backend's clock
+        if self.install_clock:
+            self.clock.install()
+            timer_queue.use_source(self)
+
+    def close(self):
+        if self._run_until in self.clock.listeners:
+            self.clock.listeners.remove(self._run_until)
+        self.clock.uninstall()
+        if timer_queue.source is self:
+            timer_queue.use_source(None)
+
+    # --- simulation inputs ---
+
+    def set_input(self, channel, level):
+        """
+        Drive an input pin now, firing edge detection if the level changes
+        """
+        level = int(bool(level))
+        if self.levels.get(channel) == level:
+            return
+        self.levels[channel] = level
+        wait = self._edge_waits.get(channel)
+        if (wait is not None) and not ((wait[0] == self.RISING and not level) or (wait[0] == self.FALLING and level)):
+            wait[1] = True
+        event = self._events.get(channel)
+        if event is None:
+            return
+        edge, callback, bouncetime_secs, last_event_time = event[:4]
+        if (edge == self.RISING and not level) or (edge == self.FALLING and level):
+            return
+        now = self.clock.now
+        if (last_event_time is not None) and (now - last_event_time < bouncetime_secs):
+            return
+        event[3] = now
+        event[4] = True
+        if callback is not None:
+            callback(channel)
+
+    def drive(self, channel, waveform, start=None):
+        """
+        Schedule a waveform on an input pin
+
+        args:
+            channel: (int) input pin
+            waveform: list((float, int)). (seconds after start, level) pairs
+            start: (float) clock time the waveform starts at. Defaults to now
+        """
+        start = self.clock.now if start is None else start
+        for offset, level in waveform:
+            self.schedule(start + offset, lambda level=level: self.set_input(channel, level))
+
+    def watch_output(self, channel, func):
+        """
+        Call func(level) on every transition of an output pin. Used by simulated peripherals
+        """
+        self._output_watchers.setdefault(channel, []).append(func)
+
+    def transitions(self, channel):
+        """
+        Returns the logged (time, level) output transitions of one pin
+        """
+        return [(t, level) for t, pin, level in self.log if pin == channel]
+
+
+def quadrature(steps, period=0.01):
+    """
+    Returns (clk_waveform, dt_waveform) for a rotary encoder turned steps detents.
+    Each detent is a full quadrature cycle (4 transitions) lasting period seconds.
+    CLK leads DT for positive steps.
+
+    args:
+        steps: (int) signed number of detents
+        period: (float) seconds per detent
+    """
+    leading, lagging = [], []
+    quarter = period / 4
+    for i in range(abs(steps)):
+        t = i * period
+        leading += [(t, 1), (t + 2*quarter, 0)]
+        lagging += [(t + quarter, 1), (t + 3*quarter, 0)]
+    if steps >= 0:
+        return leading, lagging
+    return lagging, leading
+
+
+def bounce(press_at, release_at, pressed_level=1, bounces=3, bounce_period=0.001):
+    """
+    Returns a button waveform pressed at press_at and released at release_at,
+    with contact chatter after each transition
+
+    args:
+        press_at: (float) seconds
+        release_at: (float) seconds
+        pressed_level: (int) input level while pressed
+        bounces: (int) number of chatter pulses per transition
+        bounce_period: (float) seconds per chatter pulse
+    """
+    waveform = []
+    for at, level in [(press_at, pressed_level), (release_at, 1 - pressed_level)]:
+        for i in range(bounces):
+            waveform += [(at + i*bounce_period, level), (at + (i + 0.5)*bounce_period, 1 - level)]
+        waveform.append((at + bounces*bounce_period, level))
+    return waveform
+
+
+class SimHX711():
+    def __init__(self, gpio, data_pin, clock_pin, values, period=0.1):
+        """
+        Simulated HX711. Pulls DOUT low when a conversion is ready, then shifts the
+        24 bit two's complement value out MSB first on CLOCK rising edges.
+
+        args:
+            gpio: (SimGPIO)
+            data_pin: (int) DOUT pin
+            clock_pin: (int) PD_SCK pin
+            values: iterable(int). Signed readings to output, in order (the last one repeats)
+            period: (float) seconds per conversion (0.1 for 10 SPS, 0.0125 for 80 SPS)
+        """
+        self.gpio = gpio
+        self.DATA = data_pin
+        self.CLOCK = clock_pin
+        self.period = period
+        self.values = iter(values)
+        self.value = 0
+        self.pulses = 0
+        self.conversions = 0
+        self.gain_pulses = None
+        self.ready = False
+        gpio.setup(data_pin, gpio.IN, pull_up_down=gpio.PUD_UP)
+        gpio.set_input(data_pin, 1)
+        gpio.watch_output(clock_pin, self._clock)
+        self._start_conversion()
+
+    def _start_conversion(self):
+        self.gpio.schedule(self.gpio.clock.now + self.period, self._conversion_ready)
+
+    def _conversion_ready(self):
+        self.value = next(self.values, self.value)
+        self.ready = True
+        self.pulses = 0
+        self.gpio.set_input(self.DATA, 0)
+
+    def _clock(self, level):
+        if (not level) or (not self.ready):
+            return
+        self.pulses += 1
+        if self.pulses <= 24:
+            bit = ((self.value & 0xFFFFFF) >> (24 - self.pulses)) & 1
+            self.gpio.set_input(self.DATA, bit)
+        if self.pulses == 25:
+            self.gpio.set_input(self.DATA, 1)
+            self.gpio.schedule(self.gpio.clock.now + 0.0001, self._end_conversion)
+
+    def _end_conversion(self):
+        # runs once the gain/channel pulses after the 24 data bits have been counted
+        self.gain_pulses = self.pulses - 24
+        self.ready = False
+        self.conversions += 1
+        self._start_conversion()
@@ -1,13 +1,235 @@
 #!/usr/bin/env python3
 
 
-import RPi.GPIO as GPIO
+import itertools
+import threading
 import time
+from collections import OrderedDict
 
-if __name__ == "__main__":
+import numpy as np
+
+if __name__ in ("__main__", "stepper"):
     from base import BaseIO
+    from gpio import GPIO
 else:
     from rpigpio.base import BaseIO
+    from rpigpio.gpio import GPIO
+
+
+class RampProfile():
+    def __init__(self, accel, n_cruise, cruise_pause):
+        """
+        Read-only sequence of step pauses for a trapezoidal move.
+        Only the acceleration pauses are stored. The constant speed section
+        is a single repeated value, and the deceleration section is a
+        reversed view of the acceleration array.
+
+        args:
+            accel: (np.ndarray) pauses (seconds) for the acceleration steps
+            n_cruise: (int) number of constant speed steps
+            cruise_pause: (float) pause (seconds) for each constant speed step
+        """
+        accel.flags.writeable = False
+        self.accel = accel
+        self.decel = accel[::-1]
+        self.n_cruise = n_cruise
+        self.cruise_pause = cruise_pause
+
+    def __len__(self):
+        return 2*len(self.accel) + self.n_cruise
+
+    def __iter__(self):
+        accel = self.accel.tolist()
+        return itertools.chain(
+                accel,
+                itertools.repeat(self.cruise_pause, self.n_cruise),
+                reversed(accel))
+
+    def __getitem__(self, i):
+        n = len(self)
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(n))]
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("RampProfile index out of range")
+        n_accel = len(self.accel)
+        if i < n_accel:
+            return float(self.accel[i])
+        if i < n_accel + self.n_cruise:
+            return self.cruise_pause
+        return float(self.decel[i - n_accel - self.n_cruise])
+
+    def to_array(self):
+        """
+        Returns the full pause sequence as a single (copied) numpy array
+        """
+        return np.concatenate([
+                self.accel,
+                np.full(self.n_cruise, self.cruise_pause),
+                self.decel])
+
+
+class StepTiming():
+    def __init__(self, capacity=100000, tolerance=0.0001):
+        """
+        Records scheduled vs actual STEP pulse times into preallocated arrays,
+        to measure how far pulses drift from the ramp schedule under load.
+
+        args:
+            capacity: (int) maximum number of pulses recorded. Further pulses are counted in self.dropped
+            tolerance: (float) seconds of lateness beyond which a pulse counts as a missed deadline
+        """
+        self.capacity = capacity
+        self.tolerance = tolerance
+        self.scheduled = np.zeros(capacity)
+        self.actual = np.zeros(capacity)
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.dropped = 0
+
+    def record(self, scheduled, actual):
+        """
+        Record one pulse
+
+        args:
+            scheduled: (float) time.time() the pulse was due
+            actual: (float) time.time() the pulse was sent
+        """
+        i = self.n
+        if i < self.capacity:
+            self.scheduled[i] = scheduled
+            self.actual[i] = actual
+            self.n = i + 1
+        else:
+            self.dropped += 1
+
+    def lateness(self):
+        """
+        Returns an array of seconds each recorded pulse was late (negative if early)
+        """
+        return self.actual[:self.n] - self.scheduled[:self.n]
+
+    def stats(self):
+        """
+        Returns a dict of summary statistics (times in seconds)
+        """
+        lateness = self.lateness()
+        if self.n == 0:
+            return {"n": 0, "dropped": self.dropped}
+        elapsed = float(self.actual[self.n-1] - self.actual[0])
+        return {
+                "n": self.n,
+                "dropped": self.dropped,
+                "mean": float(lateness.mean()),
+                "p50": float(np.percentile(lateness, 50)),
+                "p99": float(np.percentile(lateness, 99)),
+                "max": float(lateness.max()),
+                "missed": int((lateness > self.tolerance).sum()),
+                "steps_per_sec": (self.n - 1) / elapsed if elapsed > 0 else float("nan")}
+
+    def histogram(self, bins=50):
+        """
+        Returns (counts, bin_edges) of pulse lateness. See np.histogram()
+        """
+        return np.histogram(self.lateness(), bins=bins)
+
+    def export_histogram(self, path, bins=50):
+        """
+        Write the lateness histogram to a csv file with columns lower,upper,count
+
+        args:
+            path: (str) output file path
+            bins: (int) number of bins
+        """
+        counts, edges = self.histogram(bins)
+        with open(path, "w") as f:
+            f.write("lower,upper,count\n")
+            for i in range(len(counts)):
+                f.write("{},{},{}\n".format(edges[i], edges[i+1], counts[i]))
+
+
+class StepperMove():
+    def __init__(self, stepper, n_steps, direction, rpm, use_ramp=True, stream=False):
+        """
+        Future-like handle for a move run by Stepper.move_async() in a worker thread.
+
+        args:
+            stepper: (Stepper) the motor to move
+            n_steps, direction, rpm, use_ramp, stream: see Stepper.step()
+        """
+        self.stepper = stepper
+        self.n_steps = n_steps
+        self.direction = direction
+        self.rpm = rpm
+        self.use_ramp = use_ramp
+        self.steps_done = 0
+        self.exception = None
+        self._step_pauses = stepper._step_pauses(n_steps, rpm, use_ramp, stream)
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        """
+        Request the move to stop. If ramping, the motor decelerates first
+        """
+        self._cancel_event.set()
+
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def done(self):
+        return self._done_event.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Block until the move finishes. Returns True if it finished within timeout
+        """
+        return self._done_event.wait(timeout)
+
+    def result(self, timeout=None):
+        """
+        Block until the move finishes and return the number of steps taken.
+        Re-raises any exception from the worker thread.
+        """
+        if not self._done_event.wait(timeout):
+            raise TimeoutError("Move not finished after {}s".format(timeout))
+        if self.exception is not None:
+            raise self.exception
+        return self.steps_done
+
+    @property
+    def progress(self):
+        """
+        Fraction of n_steps completed
+        """
+        return self.steps_done / self.n_steps if self.n_steps else 1.0
+
+    def _count_step(self):
+        self.steps_done += 1
+
+    def _run(self):
+        stepper = self.stepper
+        try:
+            if GPIO.input(stepper.SLEEP) == GPIO.LOW:
+                stepper.wake()
+            GPIO.output(stepper.DIR, self.direction)
+            timestamp = stepper._pulse(self._step_pauses, time.time(), self._cancel_event.is_set, self._count_step)
+            if self.cancelled() and self.use_ramp:
+                # decelerate from the current ramp position
+                n_accel = len(stepper._ramp_shape(self.n_steps, self.rpm)[0])
+                k = min(self.steps_done, n_accel, self.n_steps - self.steps_done)
+                stepper._pulse(stepper.decel_iter(k), timestamp, lambda: False, self._count_step)
+        except Exception as e:
+            self.exception = e
+        finally:
+            self._done_event.set()
 
 
 class Stepper(BaseIO):
@@ -23,7 +245,8 @@ class Stepper(BaseIO):
             acceleration=600,
             starting_rpm=6,
             microstep_mode=1,
-            driver="drv8825"):
+            driver="drv8825",
+            ramp_cache_size=32):
         """
         Class handling manual interactions with a stepper motor
 
@@ -40,6 +263,7 @@ class Stepper(BaseIO):
             microstep_mode: (int) microstepping denominator
                             - e.g. "2" for "1/2", "8" for "1/8", or "1" for full step mode
             driver: (str) e.g "drv8825"                
+            ramp_cache_size: (int) maximum number of ramp profiles memoized by ramp()
         """
         # define instance variables
         self.DIR = dir_pin
@@ -53,6 +277,10 @@ class Stepper(BaseIO):
         self.START_RPM = starting_rpm
         self.MICROSTEP_MODE = microstep_mode
         self.DRIVER = driver.lower()
+        self.RAMP_CACHE_SIZE = ramp_cache_size
+        self._ramp_cache = OrderedDict()
+        self._active_move = None
+        self.TIMING = None
 
         # define microstep map
         # THESE ARE ORDERED MS2,MS1,MS0 AS PER DRV8825 DATASHEET***t pull
@@ -88,14 +316,64 @@ class Stepper(BaseIO):
             mode: microstepping denominator. Must be in self.microsteps keys
         """
         assert mode in self.microsteps.keys()
-        GPIO.output(self.MS0, self.microsteps[mode][2])
-        GPIO.output(self.MS1, self.microsteps[mode][1])
-        GPIO.output(self.MS2, self.microsteps[mode][0])
+        GPIO.output([self.MS2, self.MS1, self.MS0], list(self.microsteps[mode]))
         self.MICROSTEP_MODE = mode
-        
+        self.clear_ramp_cache()
+
+    def set_acceleration(self, acceleration=None, starting_rpm=None):
+        """
+        Change the ramping parameters. Invalidates memoized ramp profiles.
+
+        args:
+            acceleration: (number) rpm per second
+            starting_rpm: (number) minimum rpm for ramping profile to start with
+        """
+        if acceleration is not None:
+            self.ACCEL = acceleration
+        if starting_rpm is not None:
+            self.START_RPM = starting_rpm
+        self.clear_ramp_cache()
+
+    def clear_ramp_cache(self):
+        """
+        Discard all memoized ramp profiles
+        """
+        self._ramp_cache.clear()
+
+    def _accel_iter(self, target_rpm):
+        """
+        Generator yielding acceleration pauses (seconds) from START_RPM until target_rpm is reached.
+        rpm rises by ACCEL per second of elapsed time, updated once per step, so each
+        pause is set by the time taken by the pauses before it
+        """
+        spr = self.STEPS_PER_REV
+        rpm = self.START_RPM
+        elapsed = 0
+        while rpm < target_rpm:
+            pause = 1/(spr * rpm/60)
+            yield pause
+            elapsed += pause
+            rpm = self.START_RPM + (elapsed * self.ACCEL)
+
+    def _ramp_shape(self, n_steps, target_rpm):
+        """
+        Returns (accel, cruise_pause): the list of acceleration pauses (the deceleration
+        pauses are the same, reversed), at most n_steps // 2 of them, and the pause for
+        each of the n_steps - 2*len(accel) constant speed steps
+        """
+        if self.ACCEL <= 0:
+            # the speed never changes, so the whole move is at the starting speed
+            return [], 1/(self.STEPS_PER_REV * min(self.START_RPM, target_rpm)/60)
+        accel = list(itertools.islice(self._accel_iter(target_rpm), n_steps//2 + 1))
+        if len(accel) > n_steps // 2:
+            # target_rpm not reached: hold the next ramp speed for the odd middle step
+            return accel[:-1], accel[-1]
+        return accel, 1/(self.STEPS_PER_REV * target_rpm/60)
+
     def ramp(self, n_steps, target_rpm):
         """
-        Calculates ramping steps and pauses for the input sequence. Returns a list of pauses.
+        Calculates ramping steps and pauses for the input sequence. Returns a RampProfile
+        of n_steps pauses. Profiles are memoized in a bounded LRU cache.
     
         args:
             n_steps: (int) total number of steps in the sequence, including ramp up/down steps.
@@ -103,25 +381,57 @@ class Stepper(BaseIO):
                      If actual rpm < target_rpm after n_steps/2, then target_rpm will not be reached.
             target_rpm: (number) Max rpm. Once reached the ramp logic transistions to constant speed.
         """  
-        target_pause_per_step = 1/(self.STEPS_PER_REV * target_rpm/60)
-        pauses = []  # list to be populated with the sequence of pauses
-        pause = 1/(self.STEPS_PER_REV * self.START_RPM / 60)  
-        elapsed = 0#pause
-        current_rpm = self.START_RPM
-        step_count = 0
-        # ramp
-        while (step_count < n_steps/2) & (current_rpm < target_rpm):
-            pauses.append(pause)
-            elapsed += pause
-            current_rpm = self.START_RPM + (elapsed * self.ACCEL)
-            pause = 1/(self.STEPS_PER_REV * current_rpm / 60)             
-            step_count += 1
-        pauses.extend([target_pause_per_step for i in range(int(n_steps/2) - step_count)])
-        if n_steps > 1:
-            pauses.extend(list(reversed(pauses)))    
-        return pauses                      
-            
-    def step(self, n_steps=1, direction=1, rpm=60, use_ramp=True, continue_func=lambda: True):
+        key = (n_steps, target_rpm, self.START_RPM, self.ACCEL, self.STEPS_PER_REV)
+        profile = self._ramp_cache.get(key)
+        if profile is not None:
+            self._ramp_cache.move_to_end(key)
+            return profile
+        accel, cruise_pause = self._ramp_shape(n_steps, target_rpm)
+        profile = RampProfile(np.array(accel, dtype=np.float64), n_steps - 2*len(accel), cruise_pause)
+        self._ramp_cache[key] = profile
+        if len(self._ramp_cache) > self.RAMP_CACHE_SIZE:
+            self._ramp_cache.popitem(last=False)
+        return profile
+
+    def ramp_iter(self, n_steps, target_rpm):
+        """
+        Generator yielding the same pauses as ramp(), one step at a time.
+        Only the acceleration pauses are held, so memory is bounded by the
+        ramp length rather than the move length, which suits very long moves
+        (e.g. millions of microsteps).
+
+        args:
+            n_steps: (int) total number of steps in the sequence, including ramp up/down steps.
+            target_rpm: (number) Max rpm. See ramp()
+        """
+        accel, cruise_pause = self._ramp_shape(n_steps, target_rpm)
+        yield from accel
+        yield from itertools.repeat(cruise_pause, n_steps - 2*len(accel))
+        yield from reversed(accel)
+
+    def decel_iter(self, k):
+        """
+        Generator yielding the pauses to decelerate from ramp position k
+        (i.e. the speed reached after k acceleration steps) down to START_RPM.
+
+        args:
+            k: (int) number of deceleration steps
+        """
+        if self.ACCEL <= 0:
+            return
+        yield from reversed(list(itertools.islice(self._accel_iter(float("inf")), k)))
+
+    def _step_pauses(self, n_steps, rpm, use_ramp, stream):
+        """
+        Returns an iterable of n_steps pauses. See step() for args
+        """
+        if use_ramp and stream:
+            return self.ramp_iter(n_steps, rpm)
+        elif use_ramp:
+            return self.ramp(n_steps, rpm)
+        return itertools.repeat(1/(self.STEPS_PER_REV * rpm/60), n_steps)
+
+    def step(self, n_steps=1, direction=1, rpm=60, use_ramp=True, continue_func=lambda: True, stream=False):
         """
         Effect steps by toggling STEP pin high, 
         and then low. Speed is controlled by rpm. Acceleration/deceleration
@@ -132,25 +442,99 @@ class Stepper(BaseIO):
             direction: (int) 1|0 signifying the direction of the step.
             rpm: (float) revoluations per minute
             use_ramp: (bool) if True, applies ramp() accelaration/deceleartion
+            stream: (bool) if True, ramp pauses are generated step by step by ramp_iter()
+                    rather than built up front by ramp(). Use for very long moves
             continue_func: (callable function returning boolean).
                            If function returns True, continue. Else stop stepping
         """
         timestamp = time.time()
-        if use_ramp:
-            step_pauses = self.ramp(n_steps, rpm)
+        step_pauses = self._step_pauses(n_steps, rpm, use_ramp, stream)
         if GPIO.input(self.SLEEP) == GPIO.LOW:
             print("wake DRV8825")
             self.wake()
         GPIO.output(self.DIR, direction)
-        for step_pause in step_pauses:
+
+        def stop():
             if continue_func():
-                time.sleep(max(step_pause - (time.time()-timestamp), 0))
-                GPIO.output(self.STEP, GPIO.HIGH)
-                GPIO.output(self.STEP, GPIO.LOW)
-                timestamp = time.time()
-            else:
-                print("Limit Triggered or target tension reached")
+                return False
+            print("Limit Triggered or target tension reached")
+            return True
+
+        self._pulse(step_pauses, timestamp, stop)
+
+    def _pulse(self, step_pauses, timestamp, stop, on_step=None):
+        """
+        Pulse STEP once per pause, until the pauses run out or stop() returns True.
+        Shared by step() and StepperMove. Returns the timestamp of the last pulse
+
+        args:
+            step_pauses: iterable of pauses (seconds) before each step
+            timestamp: (float) time.time() the first pause is measured from
+            stop: callable, checked before each step
+            on_step: optional callable, called after each step
+        """
+        if self.TIMING is not None:
+            return self._pulse_timed(step_pauses, timestamp, stop, on_step, self.TIMING)
+        for step_pause in step_pauses:
+            if stop():
                 break
+            time.sleep(max(step_pause - (time.time()-timestamp), 0))
+            GPIO.output(self.STEP, GPIO.HIGH)
+            GPIO.output(self.STEP, GPIO.LOW)
+            timestamp = time.time()
+            if on_step is not None:
+                on_step()
+        return timestamp
+
+    def _pulse_timed(self, step_pauses, timestamp, stop, on_step, timing):
+        """
+        As _pulse(), also recording each pulse in timing (StepTiming).
+        Kept separate so the untimed loop pays nothing for the instrumentation
+        """
+        for step_pause in step_pauses:
+            if stop():
+                break
+            time.sleep(max(step_pause - (time.time()-timestamp), 0))
+            timing.record(timestamp + step_pause, time.time())
+            GPIO.output(self.STEP, GPIO.HIGH)
+            GPIO.output(self.STEP, GPIO.LOW)
+            timestamp = time.time()
+            if on_step is not None:
+                on_step()
+        return timestamp
+
+    def enable_timing(self, capacity=100000, tolerance=0.0001):
+        """
+        Start recording scheduled vs actual pulse times for step() and move_async().
+        Returns the StepTiming recorder (also available as self.TIMING).
+
+        args:
+            see StepTiming
+        """
+        self.TIMING = StepTiming(capacity, tolerance)
+        return self.TIMING
+
+    def disable_timing(self):
+        """
+        Stop recording pulse times. The pulse loops then run uninstrumented
+        """
+        self.TIMING = None
+
+    def move_async(self, n_steps=1, direction=1, rpm=60, use_ramp=True, stream=False):
+        """
+        Start a move in a dedicated worker thread and return immediately.
+        The returned StepperMove handle supports cancel(), wait(), result()
+        and progress reporting. Cancelling decelerates along the active ramp.
+        Only one move can be active per Stepper.
+
+        args:
+            see step()
+        """
+        if (self._active_move is not None) and (not self._active_move.done()):
+            raise RuntimeError("Stepper is already moving")
+        self._active_move = StepperMove(self, n_steps, direction, rpm, use_ramp, stream)
+        self._active_move.start()
+        return self._active_move
 
     def sleep(self):
         """
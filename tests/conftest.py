@@ -0,0 +1,52 @@
+"""
+pytest configuration. Imports the rpigpio package from this checkout and
+provides a fresh simulated GPIO backend (see sim.py) per test.
+
+usage:
+    python -m pytest tests
+"""
+
+
+import os
+import sys
+import threading
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO, "benchmarks"))
+
+from checkout import import_rpigpio
+
+rpigpio = import_rpigpio()
+
+
+@pytest.fixture
+def sim():
+    """
+    A SimGPIO backend with its virtual clock installed, removed again after the test
+    """
+    from rpigpio import gpio
+    from rpigpio.sim import SimGPIO
+    backend = rpigpio.set_backend(SimGPIO())
+    yield backend
+    backend.close()
+    gpio._backend = None
+    gpio.GPIO.__dict__.clear()
+
+
+@pytest.fixture
+def run_until(sim):
+    """
+    Returns run_until(predicate, timeout=2): advances the virtual clock in small steps,
+    giving real threads (e.g. EdgeDispatcher workers) time to run, until predicate()
+    is true or timeout real seconds have passed. Returns predicate()
+    """
+    def run_until(predicate, timeout=2, step=0.01):
+        for i in range(int(timeout / 0.005)):
+            if predicate():
+                return True
+            sim.clock.advance(step)
+            threading.Event().wait(0.005)
+        return predicate()
+    return run_until
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+import run as benchmarks
+from rpigpio import gpio
+
+
+def results(**per_op_us):
+    return {"results": {name: {"per_op_us": us} for name, us in per_op_us.items()}}
+
+
+def test_compare_flags_slowdowns_beyond_threshold(capsys):
+    baseline = results(a=1.0, b=1.0, c=1.0)
+    new = results(a=1.2, b=1.3, c=0.5, d=2.0)
+    assert benchmarks.compare(new, baseline, threshold=0.25) == ["b"]
+    assert benchmarks.compare(new, baseline, threshold=0.1) == ["a", "b"]
+    output = capsys.readouterr().out
+    assert "REGRESSION" in output
+    assert "new" in output  # d has no baseline
+
+
+def test_run_keeps_the_fastest_timed_run(sim, monkeypatch):
+    calls = []
+
+    def fake(rpigpio):
+        calls.append(len(calls))
+        return {"fake": (10, [1.0, 3.0, 4.0][len(calls) - 1])}
+    monkeypatch.setattr(benchmarks, "BENCHMARKS", [fake])
+    try:
+        result = benchmarks.run(repeat=2, warmup=1)
+    finally:
+        gpio.get_backend().close()
+    # the warm-up run's 1.0 is discarded, although it is the fastest
+    assert len(calls) == 3
+    assert result["results"]["fake"] == {"n_ops": 10, "seconds": 3.0, "per_op_us": pytest.approx(3e5)}
+    assert json.loads(json.dumps(result))["meta"]["warmup"] == 1
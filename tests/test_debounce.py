@@ -0,0 +1,27 @@
+from rpigpio import Button, Debouncer
+from rpigpio.sim import bounce
+
+
+def test_bouncing_press_counts_once(sim):
+    button = Button(button_pin=14, pull_up=True, debounce_delay_secs=0.02, pressed_level=0)
+    start = sim.clock.now
+    sim.drive(14, bounce(0.01, 0.2, pressed_level=0))
+    sim.clock.advance(0.5)
+    debouncer = button.debouncer
+    assert (debouncer.presses, debouncer.releases, debouncer.glitches) == (1, 1, 0)
+    # changes are timestamped with the first edge of each burst
+    assert [(round(t - start, 4), level) for t, level in debouncer.history] == [(0.01, 0), (0.2, 1)]
+    assert button.get_state() == 1
+
+
+def test_short_pulse_is_a_glitch(sim):
+    sim.setup(14, sim.IN, pull_up_down=sim.PUD_DOWN)
+    changes = []
+    debouncer = Debouncer(14, stability_secs=0.02, on_change=lambda level, t: changes.append(level))
+    sim.drive(14, [(0.01, 1), (0.012, 0)])
+    sim.clock.advance(0.1)
+    assert (debouncer.presses, debouncer.glitches, changes) == (0, 1, [])
+    sim.drive(14, [(0.01, 1)])
+    sim.clock.advance(0.1)
+    assert (debouncer.presses, changes) == (1, [1])
+    debouncer.close()
@@ -0,0 +1,86 @@
+import asyncio
+
+from rpigpio import EdgeDispatcher
+
+
+def toggle(sim, pin, n):
+    for i in range(n):
+        sim.set_input(pin, (i + 1) % 2)
+
+
+def test_worker_threads_keep_edge_order(sim, run_until):
+    sim.setup(14, sim.IN)
+    levels = []
+    dispatcher = EdgeDispatcher(workers=2)
+    dispatcher.add(14, sim.BOTH, lambda channel, level, timestamp: levels.append(level))
+    toggle(sim, 14, 6)
+    assert run_until(lambda: len(levels) == 6)
+    assert levels == [1, 0, 1, 0, 1, 0]
+    dispatcher.close()
+
+
+def test_edge_filter_and_stats(sim, run_until):
+    sim.setup(14, sim.IN)
+    falling = []
+    dispatcher = EdgeDispatcher(workers=1)
+    dispatcher.add(14, sim.FALLING, lambda channel, level, timestamp: falling.append(level))
+    toggle(sim, 14, 6)
+    assert run_until(lambda: len(falling) == 3)
+    stats = dispatcher.stats()
+    # only falling edges are detected on a pin with no other handlers
+    assert stats["edges"] == 3
+    assert stats["handlers"][0]["calls"] == 3
+    dispatcher.close()
+
+
+def test_single_edge_level_is_not_read_back(sim, run_until):
+    sim.setup(14, sim.IN)
+    levels = []
+    dispatcher = EdgeDispatcher(workers=1)
+    dispatcher.add(14, sim.RISING, lambda channel, level, timestamp: levels.append(level))
+    # a pulse that has already ended when the GPIO callback runs
+    callback = sim._events[14][1]
+    callback(14)
+    assert run_until(lambda: levels == [1])
+    # a FALLING handler on the same pin switches the callback to BOTH, reading the pin
+    dispatcher.add(14, sim.FALLING, lambda channel, level, timestamp: levels.append(-1))
+    toggle(sim, 14, 2)
+    assert run_until(lambda: levels == [1, 1, -1])
+    dispatcher.close()
+
+
+def test_closed_loop_registration_is_dropped(sim, run_until):
+    sim.setup(14, sim.IN)
+    loop = asyncio.new_event_loop()
+    dispatcher = EdgeDispatcher(loop=loop)
+    dispatcher.add(14, sim.BOTH, lambda channel, level, timestamp: None)
+    loop.close()
+    toggle(sim, 14, 1)
+    assert run_until(lambda: dispatcher.orphaned == 1)
+    assert 14 not in dispatcher.registrations
+    assert dispatcher._threads[0].is_alive()  # the fan-out thread survived
+    dispatcher.close()
+
+
+def test_asyncio_handlers_are_awaited_in_order(sim):
+    sim.setup(14, sim.IN)
+    levels = []
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        dispatcher = EdgeDispatcher(loop=loop)
+
+        async def handler(channel, level, timestamp):
+            # rising edges take longer, so running them concurrently would reorder them
+            for i in range(5 * level + 1):
+                await asyncio.sleep(0)
+            levels.append(level)
+        dispatcher.add(14, sim.BOTH, handler)
+        await loop.run_in_executor(None, toggle, sim, 14, 6)
+        for i in range(1000):
+            if len(levels) == 6:
+                break
+            await asyncio.sleep(0)
+        dispatcher.close()
+    asyncio.run(main())
+    assert levels == [1, 0, 1, 0, 1, 0]
@@ -0,0 +1,33 @@
+import pytest
+
+from rpigpio import Display4s7s
+
+
+def test_build_frame(sim):
+    display = Display4s7s()
+    levels = display.char_levels
+    dotted_one = list(levels["1"])
+    dotted_one[display.DOT_INDEX] = 1
+    assert display.build_frame("1.2-3") == (tuple(dotted_one), levels["2"], levels["-"], levels["3"])
+    assert display.build_frame(7) == (levels[" "],) * 3 + (levels["7"],)
+    assert display.build_frame(3.14159, decimals=2) == display.build_frame("3.14")
+    with pytest.raises(AssertionError):
+        display.build_frame(12345)
+
+
+def test_refresh_thread_multiplexes_evenly(sim, run_until):
+    display = Display4s7s()
+    display.show(1234)
+    assert run_until(lambda: display.cycles >= 20)
+    display.stop()
+    # every digit lit the same number of times, one at a time
+    lit = [sum(1 for t, level in sim.transitions(pin) if level == 0) for pin in display.digit_pins]
+    assert max(lit) - min(lit) <= 1
+    assert [sim.levels[pin] for pin in display.digit_pins] == [1, 1, 1, 1]
+
+
+def test_zero_lights_the_outer_segments(sim):
+    display = Display4s7s()
+    lit = {k for k, level in zip(display.segment_order, display.char_levels["0"]) if level}
+    assert lit == {"bl", "bm", "br", "tl", "tm", "tr"}
+    assert all(sim.directions[pin] == sim.OUT for pin in display.segment_pins + display.digit_pins)
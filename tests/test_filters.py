@@ -0,0 +1,66 @@
+import random
+import statistics
+
+import pytest
+
+from rpigpio import EMA, FilterChain, Kalman1D, RunningMedian, SpikeRejector, TrimmedMean
+
+
+@pytest.mark.parametrize("window", [1, 2, 5, 16])
+def test_running_median_matches_brute_force(window):
+    rng = random.Random(window)
+    f = RunningMedian(window)
+    samples = []
+    for i in range(500):
+        x = rng.randint(-20, 20)  # plenty of duplicates
+        samples.append(x)
+        assert f.update(x) == statistics.median(samples[-window:])
+
+
+def test_running_median_heaps_stay_bounded():
+    f = RunningMedian(5)
+    for i in range(10000):
+        f.update(i % 7)
+    assert len(f._low) + len(f._high) <= 2 * f.WINDOW + 2
+
+
+@pytest.mark.parametrize("window, trim", [(1, 0), (5, 1), (10, 2), (10, 4)])
+def test_trimmed_mean_matches_brute_force(window, trim):
+    rng = random.Random(window * 10 + trim)
+    f = TrimmedMean(window, trim)
+    samples = []
+    for i in range(300):
+        x = rng.uniform(-100, 100)
+        samples.append(x)
+        ordered = sorted(samples[-window:])
+        cut = min(trim, (len(ordered) - 1) // 2)
+        expected = statistics.mean(ordered[cut:len(ordered) - cut])
+        assert f.update(x) == pytest.approx(expected)
+
+
+def test_ema():
+    f = EMA(alpha=0.5)
+    assert f.update(10) == 10
+    assert f.update(20) == 15
+    f.reset()
+    assert f.value is None
+
+
+def test_kalman_converges():
+    f = Kalman1D(process_var=0.01, measurement_var=1)
+    rng = random.Random(1)
+    for i in range(500):
+        f.update(50 + rng.gauss(0, 1))
+    assert f.value == pytest.approx(50, abs=0.5)
+
+
+def test_spike_rejector_accepts_step_after_max_rejects():
+    f = SpikeRejector(threshold=10, max_rejects=2)
+    assert [f.update(x) for x in [0, 100, 100, 100, 101]] == [0, 0, 0, 100, 101]
+    assert f.rejected == 2
+
+
+def test_filter_chain():
+    chain = FilterChain(SpikeRejector(threshold=10, max_rejects=5), RunningMedian(3))
+    values = [chain.update(x) for x in [1, 2, 1000, 3]]
+    assert values == [1, 1.5, 2, 2]
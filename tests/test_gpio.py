@@ -0,0 +1,86 @@
+import pytest
+
+from rpigpio.gpio import GPIOBackend, MMapGPIOBackend
+
+
+@pytest.fixture
+def regs_file(tmp_path):
+    path = tmp_path / "gpiomem"
+    path.write_bytes(b"")
+    return str(path)
+
+
+@pytest.fixture
+def mmap_backend(regs_file):
+    backend = MMapGPIOBackend(path=regs_file)
+    yield backend
+    backend.close()
+
+
+def test_mmap_function_select(mmap_backend):
+    regs = mmap_backend._regs
+    assert len(regs) * 4 == MMapGPIOBackend.BLOCK_SIZE
+    mmap_backend.setup(17, GPIOBackend.OUT)
+    mmap_backend.setup(12, GPIOBackend.IN)
+    # GPFSEL1 holds pins 10-19, 3 bits each
+    assert (regs[MMapGPIOBackend.GPFSEL0 + 1] >> 21) & 0b111 == 0b001
+    assert (regs[MMapGPIOBackend.GPFSEL0 + 1] >> 6) & 0b111 == 0b000
+    mmap_backend.setup(17, GPIOBackend.IN)
+    assert regs[MMapGPIOBackend.GPFSEL0 + 1] == 0
+
+
+def test_mmap_set_and_clear_masks(mmap_backend):
+    regs = mmap_backend._regs
+    mmap_backend.output(4, 1)
+    assert regs[MMapGPIOBackend.GPSET0] == 1 << 4
+    mmap_backend.output(4, 0)
+    assert regs[MMapGPIOBackend.GPCLR0] == 1 << 4
+    mmap_backend.output([2, 3, 5], [1, 0, 1])
+    assert regs[MMapGPIOBackend.GPSET0] == (1 << 2) | (1 << 5)
+    assert regs[MMapGPIOBackend.GPCLR0] == 1 << 3
+    mmap_backend.output([6, 7], 1)
+    assert regs[MMapGPIOBackend.GPSET0] == (1 << 6) | (1 << 7)
+
+
+def test_mmap_levels(mmap_backend):
+    mmap_backend._regs[MMapGPIOBackend.GPLEV0] = (1 << 9) | (1 << 27)
+    assert mmap_backend.input(9) == 1
+    assert mmap_backend.input(10) == 0
+    assert mmap_backend.input_levels([27, 9, 10]) == [1, 1, 0]
+
+
+def test_mmap_pulls_bcm2711(mmap_backend):
+    mmap_backend.setup(18, GPIOBackend.IN, pull_up_down=GPIOBackend.PUD_UP)
+    mmap_backend.setup(3, GPIOBackend.IN, pull_up_down=GPIOBackend.PUD_DOWN)
+    regs = mmap_backend._regs
+    assert (regs[MMapGPIOBackend.GPIO_PUP_PDN_CNTRL_REG0 + 1] >> 4) & 0b11 == 0b01
+    assert (regs[MMapGPIOBackend.GPIO_PUP_PDN_CNTRL_REG0] >> 6) & 0b11 == 0b10
+
+
+def test_mmap_rejects_bank_1(mmap_backend):
+    with pytest.raises(AssertionError):
+        mmap_backend.setup(40, GPIOBackend.OUT)
+
+
+def test_set_backend_closes_the_replaced_backend():
+    from rpigpio import gpio, set_backend
+
+    class Recorder(GPIOBackend):
+        def __init__(self):
+            self.calls = []
+
+        def activate(self):
+            self.calls.append("activate")
+
+        def close(self):
+            self.calls.append("close")
+    first, second = Recorder(), Recorder()
+    try:
+        set_backend(first)
+        set_backend(first)  # re-selecting the active backend doesn't close it
+        set_backend(second)
+        assert first.calls == ["activate", "activate", "close"]
+        assert second.calls == ["activate"]
+    finally:
+        gpio._backend = None
+        gpio.GPIO.__dict__.clear()
@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+
+from rpigpio import EMA, HX711, HX711Group
+from rpigpio.hx711 import read_recording, to_signed
+from rpigpio.sim import SimHX711
+
+
+def test_to_signed():
+    assert to_signed([0, 1, 0x7FFFFF, 0x800000, 0xFFFFFF]).tolist() == [0, 1, 0x7FFFFF, -0x800000, -1]
+
+
+def test_read_raw(sim):
+    chip = SimHX711(sim, 27, 17, [5, -5, 0x7FFFFF])
+    hx = HX711(data=27, clock=17, printout=False)
+    assert [hx.read_raw() for i in range(3)] == [5, -5, 0x7FFFFF]
+    assert chip.gain_pulses == 1
+    health = hx.health()
+    assert (health["conversions"], health["missed"], health["saturated"]) == (3, 0, 1)
+
+
+def test_pauses_between_reads_are_not_missed(sim):
+    SimHX711(sim, 27, 17, range(100))
+    hx = HX711(data=27, clock=17, printout=False)
+    hx.read_raw()
+    sim.clock.advance(5)
+    hx.read_raw()
+    assert hx.health()["missed"] == 0
+
+
+def test_long_clock_high_is_retried_then_raises(sim):
+    SimHX711(sim, 27, 17, range(100))
+    hx = HX711(data=27, clock=17, printout=False)
+    hx.MAX_CLOCK_HIGH = 0  # every conversion is bad
+    with pytest.raises(RuntimeError):
+        hx.read_raw()
+    assert hx.health()["retries"] == hx.MAX_RETRIES + 1
+
+
+def test_get_reading_clips_extremes(sim):
+    SimHX711(sim, 27, 17, [10, 1000, 12, -1000, 14])
+    hx = HX711(data=27, clock=17, printout=False)
+    assert hx.get_reading(n_obs=5, clip=True) == pytest.approx(12)
+
+
+def test_get_reading_without_clipping_is_the_mean(sim):
+    SimHX711(sim, 27, 17, [10, 20, 60])
+    hx = HX711(data=27, clock=17, printout=False)
+    assert hx.get_reading(n_obs=3, clip=False) == pytest.approx(30)
+
+
+def test_sampler(sim, run_until):
+    SimHX711(sim, 27, 17, range(1000))
+    hx = HX711(data=27, clock=17, printout=False)
+    sampler = hx.start_sampler(size=8, filter=EMA(alpha=1))
+    assert run_until(lambda: sampler.count >= 10)
+    sampler.stop()
+    latest, timestamp = sampler.latest()
+    values, timestamps = sampler.samples(5)
+    assert values[-1] == latest
+    assert values == sorted(values) and len(set(values)) == 5
+    assert timestamps[-1] == timestamp
+    assert sampler.filtered == latest
+    assert sampler.median(3) == values[-2]
+    assert len(sampler.samples(100)[0]) == 7
+
+
+def test_missed_edge_does_not_wait_for_timeout(sim, monkeypatch):
+    SimHX711(sim, 27, 17, [1, 2])
+    hx = HX711(data=27, clock=17, printout=False, timeout=1.0)
+    wait_for_edge = sim.wait_for_edge
+
+    def racy_wait_for_edge(channel, edge, bouncetime=None, timeout=None):
+        # DOUT falls just before the wait is armed
+        monkeypatch.setattr(sim, "wait_for_edge", wait_for_edge)
+        sim.clock.advance(sim._schedule[0][0] - sim.clock.now)
+        return wait_for_edge(channel, edge, bouncetime, timeout)
+    monkeypatch.setattr(sim, "wait_for_edge", racy_wait_for_edge)
+    start = sim.clock.now
+    assert hx.read_raw() == 1
+    # conversion ready after one period, noticed within the next 2 periods rather than after TIMEOUT
+    assert sim.clock.now - start <= 3.5 / hx.SPS
+
+
+def test_capture_and_record(sim, tmp_path):
+    SimHX711(sim, 27, 17, range(-3, 100))
+    hx = HX711(data=27, clock=17, printout=False)
+    values, timestamps = hx.capture(3)
+    assert values.tolist() == [-3, -2, -1]
+    assert np.all(np.diff(timestamps) > 0)
+    path = str(tmp_path / "hx.rec")
+    n = hx.record(path, 0.55)
+    n += hx.record(path, 0.25)
+    values, timestamps = read_recording(path)
+    assert values.tolist() == list(range(0, n))
+    assert len(timestamps) == n
+
+
+def test_sampler_counts_failed_reads(sim, run_until):
+    SimHX711(sim, 27, 17, range(1000))
+    hx = HX711(data=27, clock=17, printout=False)
+    hx.MAX_CLOCK_HIGH = 0  # every conversion is bad
+    sampler = hx.start_sampler(size=8)
+    assert run_until(lambda: sampler.failures >= 2)
+    assert sampler.count == 0
+    hx.MAX_CLOCK_HIGH = 1
+    assert run_until(lambda: sampler.count >= 2)
+    sampler.stop()
+
+
+def make_group(sim, n_chips=2):
+    pins = [27, 22, 23][:n_chips]
+    for i, pin in enumerate(pins):
+        SimHX711(sim, pin, 17, range(100 * i, 100 * i + 100))
+    return HX711Group(data_pins=pins, clock=17, printout=False)
+
+
+def test_group_read(sim):
+    group = make_group(sim)
+    assert group.read_raw() == [0, 100]
+    assert group.read_raw() == [1, 101]
+
+
+def test_group_capture(sim):
+    group = make_group(sim)
+    values, timestamps = group.capture(2)
+    assert values.tolist() == [[0, 100], [1, 101]]
+    assert timestamps.shape == (2,)
+
+
+def test_group_record(sim, tmp_path):
+    group = make_group(sim, 3)
+    path = str(tmp_path / "group.rec")
+    n = group.record(path, 0.35)
+    values, timestamps = read_recording(path)
+    assert values.shape == (n, 3)
+    assert values[:, 2].tolist() == [200 + i for i in range(n)]
+    with pytest.raises(AssertionError):
+        HX711(data=24, clock=25, printout=False).record(path, 0.1)
+
+
+def test_group_sampler(sim, run_until):
+    group = make_group(sim)
+    sampler = group.start_sampler(size=8, filter=[EMA(alpha=1), EMA(alpha=1)])
+    assert run_until(lambda: sampler.count >= 4)
+    sampler.stop()
+    (a0, b0), (a1, b1) = sampler.samples(2)[0]
+    # both chips are read on the same clock pulses
+    assert (b0 - a0, b1 - a1) == (100, 100)
+    assert sampler.mean(2) == [(a0 + a1) / 2, (b0 + b1) / 2]
+    assert sampler.filtered == [a1, b1]
@@ -0,0 +1,136 @@
+import pytest
+
+from rpigpio import FakeSMBus, LCD1602, ParallelTransport, PCF8574Transport
+
+
+@pytest.fixture
+def bus(sim):
+    return FakeSMBus()
+
+
+@pytest.fixture
+def lcd(bus):
+    lcd = LCD1602(transport=PCF8574Transport(bus=bus))
+    bus.transactions.clear()  # the 8 bit mode init nibbles don't decode as bytes
+    return lcd
+
+
+def test_fake_smbus_decodes_transport_writes(bus):
+    transport = PCF8574Transport(bus=bus)
+    writes = [(0x80, False)] + [(ord(c), True) for c in "Hello, world! 0123456789"]
+    transport.write(writes)
+    assert bus.decode() == writes
+    # packed into block writes of at most 32 data bytes
+    assert len(bus.transactions) == -(-len(writes) * 4 // 33)
+
+
+@pytest.mark.parametrize("bus_hz", [100000, 400000, 1000000])
+def test_pcf8574_spaces_bytes_by_execution_time(bus, bus_hz):
+    transport = PCF8574Transport(bus=bus, bus_hz=bus_hz)
+    writes = [(0x80, False)] + [(ord(c), True) for c in "spacing"]
+    transport.write(writes)
+    assert bus.decode() == writes
+    ports = [port for address, data in bus.transactions for port in data]
+    falls = [i for i in range(1, len(ports))
+             if (ports[i - 1] & PCF8574Transport.E) and not (ports[i] & PCF8574Transport.E)]
+    # each byte is latched on its second E fall, and the next byte on the third
+    for (bits, mode), latched, next_latched in zip(writes, falls[1::2], falls[2::2]):
+        assert (next_latched - latched) * transport.BYTE_TIME >= transport.write_delay(bits, mode)
+
+
+def test_flush_sends_only_changed_cells(lcd, bus):
+    lcd.lcd_string("Hello", lcd.LCD_LINE_1)
+    # the cursor is already at the start of line 1 after the clear, so no address is set
+    assert bus.decode() == [(ord(c), True) for c in "Hello"]
+    bus.transactions.clear()
+    lcd.lcd_string("Hallo", lcd.LCD_LINE_1)
+    assert bus.decode() == [(0x81, False), (ord("a"), True)]
+    bus.transactions.clear()
+    lcd.lcd_string("Hallo", lcd.LCD_LINE_1)
+    assert bus.transactions == []
+
+
+def latched_writes(sim, transport):
+    """
+    Returns [(time, bits, mode)] for each byte latched on the falling edges of E
+    """
+    levels = {}
+    nibbles = []
+    for t, pin, level in sim.log:
+        if (pin == transport.LCD_E) and (level == 0):
+            nibble = sum(levels.get(p, 0) << i for i, p in enumerate(transport.DATA_PINS))
+            nibbles.append((t, nibble, bool(levels.get(transport.LCD_RS, 0))))
+        levels[pin] = level
+    return [(low[0], (high[1] << 4) | low[1], low[2]) for high, low in zip(nibbles[::2], nibbles[1::2])]
+
+
+def test_parallel_writes_wait_each_execution_time(sim):
+    transport = ParallelTransport(data_pins=[6, 13, 19, 26], rs_pin=11, e_pin=5)
+    writes = [(0x01, False), (0x80, False), (ord("H"), True), (ord("i"), True)]
+    transport.write(writes)
+    latched = latched_writes(sim, transport)
+    assert [(bits, mode) for t, bits, mode in latched] == writes
+    gaps = [b[0] - a[0] for a, b in zip(latched, latched[1:])]
+    assert gaps[0] >= transport.T_HOME
+    assert gaps[1] >= transport.T_CMD
+    assert transport.T_CHR <= gaps[2] < transport.T_HOME
+
+
+def define_glyphs(lcd, n):
+    for i in range(n):
+        lcd.define_glyph("g{}".format(i), [i] * 8)
+
+
+def test_renderer_merges_posts_and_surfaces_errors(lcd, run_until):
+    define_glyphs(lcd, 9)
+    renderer = lcd.start_renderer()
+    renderer.post(0, "first")
+    renderer.post(0, "second")
+    assert run_until(lambda: bytes(lcd.shadow[0]).startswith(b"second"))
+    assert renderer.merged == 1
+    renderer.post(1, "".join("{{g{}}}".format(i) for i in range(9)))
+    assert run_until(lambda: renderer.error is not None)
+    with pytest.raises(RuntimeError):
+        renderer.post(0, "more")
+    with pytest.raises(RuntimeError):
+        renderer.stop()
+
+
+def test_glyphs_more_than_cgram_in_one_string_raise(lcd):
+    define_glyphs(lcd, 9)
+    with pytest.raises(RuntimeError):
+        lcd.lcd_string("".join("{{g{}}}".format(i) for i in range(9)), lcd.LCD_LINE_1)
+    lcd.lcd_string("".join("{{g{}}}".format(i) for i in range(8)), lcd.LCD_LINE_1)
+    assert list(lcd.frame[0][:8]) == list(range(8))
+
+
+def test_glyph_eviction_spares_glyphs_on_screen(lcd):
+    define_glyphs(lcd, 9)
+    lcd.lcd_string("".join("{{g{}}}".format(i) for i in range(8)), lcd.LCD_LINE_1)
+    lcd.lcd_string("{g1}{g2}{g3}{g4}{g5}{g6}{g7}", lcd.LCD_LINE_1)  # g0 leaves the screen
+    lcd.lcd_string("{g8}", lcd.LCD_LINE_2)
+    assert lcd.glyphs.resident["g8"] == 0
+    assert "g0" not in lcd.glyphs.resident
+    assert list(lcd.frame[0][:7]) == list(range(1, 8))
+
+
+def test_glyph_aliases_count_as_on_screen(lcd):
+    define_glyphs(lcd, 9)
+    lcd.lcd_string("".join("{{g{}}}".format(i) for i in range(8)), lcd.LCD_LINE_1)
+    lcd.lcd_string(bytes([8 + 0]), lcd.LCD_LINE_2)  # code 8 shows CGRAM slot 0
+    lcd.lcd_string("{g1}{g2}{g3}{g4}{g5}{g6}{g7}", lcd.LCD_LINE_1)
+    with pytest.raises(RuntimeError):
+        lcd.lcd_string("{g8}", lcd.LCD_LINE_1)
+
+
+def test_four_row_addresses(bus):
+    lcd = LCD1602(transport=PCF8574Transport(bus=bus), cols=20, rows=4)
+    assert [lcd.LCD_LINE_1, lcd.LCD_LINE_2, lcd.LCD_LINE_3, lcd.LCD_LINE_4] == [0x80, 0xC0, 0x94, 0xD4]
+
+
+def test_parallel_aliases(sim):
+    lcd = LCD1602(data_pins=[6, 13, 19, 26], rs_pin=11, e_pin=5)
+    assert (lcd.LCD_RS, lcd.LCD_E, lcd.LCD_D4, lcd.LCD_D7) == (11, 5, 6, 26)
+    assert lcd.E_DELAY == lcd.transport.T_CMD
+    lcd.cleanup()
+    assert not set(sim.directions) & {5, 6, 11, 13, 19, 26}
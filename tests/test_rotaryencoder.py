@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from rpigpio import RotaryEncoder
+from rpigpio.sim import bounce, quadrature
+
+
+def test_transition_table():
+    table = RotaryEncoder.TRANSITIONS
+    assert len(table) == 16
+    for old in range(4):
+        for new in range(4):
+            change = table[(old << 2) | new]
+            changed_pins = bin(old ^ new).count("1")
+            if changed_pins == 0:
+                assert change == 0
+            elif changed_pins == 2:
+                assert change is None
+            else:
+                # reversing a transition reverses the count
+                assert change in (-1, 1)
+                assert table[(new << 2) | old] == -change
+    # one full clockwise cycle (CLK leading DT): 00 -> 10 -> 11 -> 01 -> 00
+    cycle = [0b00, 0b10, 0b11, 0b01, 0b00]
+    assert [table[(a << 2) | b] for a, b in zip(cycle, cycle[1:])] == [1, 1, 1, 1]
+
+
+@pytest.mark.parametrize("steps, resolution", [(5, 1), (-3, 1), (4, 2), (-2, 4)])
+def test_quadrature_counts(sim, steps, resolution):
+    encoder = RotaryEncoder(clk=17, dt=18, button=27, resolution=resolution)
+    clk, dt = quadrature(steps)
+    sim.drive(17, clk)
+    sim.drive(18, dt)
+    sim.clock.advance(abs(steps) * 0.01 + 0.01)
+    assert encoder.COUNTER == steps * resolution
+    assert encoder.INVALID_TRANSITIONS == 0
+
+
+def test_debounce_n_is_deprecated(sim):
+    with pytest.warns(DeprecationWarning):
+        encoder = RotaryEncoder(17, 18, 27, 0, 1.0, 2)
+    assert encoder.RESOLUTION == 1
+
+
+def turn(sim, steps, period=0.01):
+    clk, dt = quadrature(steps, period)
+    sim.drive(17, clk)
+    sim.drive(18, dt)
+    sim.clock.advance(abs(steps) * period + 0.01)
+
+
+def test_unconsumed_rotations_are_merged(sim):
+    encoder = RotaryEncoder(clk=17, dt=18, button=27)
+    turn(sim, 5)
+    assert [(event.kind, event.value) for event in encoder.events] == [("rotate", 5)]
+    turn(sim, -2)
+    assert encoder.get_event(timeout=0).value == 3
+    assert encoder.get_event(timeout=0) is None
+    turn(sim, 2)
+    turn(sim, -2)
+    # rotations that cancel out leave no event
+    assert len(encoder.events) == 0
+
+
+@pytest.mark.parametrize("period, max_multiplier, counter", [
+        (1.0, 10, 5),       # slow: 1 count/sec, multiplier int(1 + 0.05) == 1
+        (0.01, 10, 25),     # fast: 100 counts/sec, multiplier 6 after the first count
+        (0.01, 3, 13)])     # capped at 3
+def test_acceleration_scales_fast_turns(sim, period, max_multiplier, counter):
+    encoder = RotaryEncoder(clk=17, dt=18, button=27, acceleration=0.05, max_multiplier=max_multiplier)
+    turn(sim, 5, period)
+    assert encoder.COUNTER == counter
+    assert encoder.get_event(timeout=0).value == counter
+
+
+def test_button_press_and_long_press(sim):
+    encoder = RotaryEncoder(clk=17, dt=18, button=27, long_press_secs=0.5)
+    sim.drive(27, bounce(0.01, 0.1, pressed_level=0))
+    sim.drive(27, bounce(0.2, 0.9, pressed_level=0))
+    sim.clock.advance(1.5)
+    assert [event.kind for event in encoder.events] == ["press", "long_press"]
+
+
+def test_double_click(sim):
+    encoder = RotaryEncoder(clk=17, dt=18, button=27, double_click_secs=0.3)
+    start = sim.clock.now
+    sim.drive(27, bounce(0.01, 0.1, pressed_level=0))
+    sim.drive(27, bounce(0.2, 0.25, pressed_level=0))
+    sim.drive(27, bounce(1.0, 1.1, pressed_level=0))
+    sim.clock.advance(1.3)
+    assert [event.kind for event in encoder.events] == ["double_click"]
+    sim.clock.advance(0.2)
+    # a single click is only reported once no second click can follow
+    event = encoder.events[-1]
+    assert event.kind == "press"
+    assert event.timestamp - start == pytest.approx(1.1, abs=0.01)
+
+
+def test_cancelled_async_iteration_leaves_no_waiter(sim):
+    encoder = RotaryEncoder(clk=17, dt=18, button=27)
+
+    async def cancel_wait():
+        task = asyncio.ensure_future(encoder.__anext__())
+        await asyncio.sleep(0)
+        assert len(encoder._async_waiters) == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(cancel_wait())
+    assert encoder._async_waiters == []
+
+
+def test_closed_loop_waiter_is_skipped(sim):
+    encoder = RotaryEncoder(clk=17, dt=18, button=27)
+    loop = asyncio.new_event_loop()
+    encoder._async_waiters.append((loop, asyncio.Event()))
+    loop.close()
+    turn(sim, 1)
+    assert encoder.COUNTER == 1
@@ -0,0 +1,42 @@
+import time
+
+import rpigpio
+from rpigpio import gpio
+from rpigpio.sim import SimGPIO
+from rpigpio.timers import timer_queue
+
+
+def test_clock_patches_time(sim):
+    start = time.monotonic()
+    time.sleep(100)
+    assert time.monotonic() - start >= 100
+    assert sim.clock.now >= 100
+
+
+def test_replacing_a_sim_backend_keeps_the_new_clock(sim):
+    real_sleep = sim.clock._real[3]
+    new = rpigpio.set_backend(SimGPIO())
+    try:
+        assert time.time == new.clock.time
+        assert timer_queue.source is new
+    finally:
+        new.close()
+        gpio._backend = None
+        gpio.GPIO.__dict__.clear()
+    assert time.sleep is real_sleep
+    assert timer_queue.source is None
+
+
+def test_scripted_input_and_output_log(sim):
+    fired = []
+    sim.setmode(sim.BCM)
+    sim.setup(4, sim.IN)
+    sim.setup(5, sim.OUT)
+    sim.add_event_detect(4, sim.RISING, callback=fired.append)
+    sim.schedule(1.0, lambda: sim.set_input(4, 1))
+    time.sleep(0.5)
+    assert fired == []
+    time.sleep(1)
+    assert fired == [4]
+    sim.output(5, 1)
+    assert [(channel, level) for t, channel, level in sim.log] == [(5, 1)]
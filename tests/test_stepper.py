@@ -0,0 +1,170 @@
+import threading
+
+import numpy as np
+import pytest
+
+from rpigpio import MultiStepper, Stepper
+from rpigpio.stepper import RampProfile, StepTiming
+
+
+def make_stepper(offset=0, **kwargs):
+    return Stepper(dir_pin=2 + offset, step_pin=3 + offset, sleep_pin=4 + offset,
+                   ms0_pin=5 + offset, ms1_pin=6 + offset, ms2_pin=7 + offset, **kwargs)
+
+
+@pytest.mark.parametrize("n_steps, rpm", [(1, 60), (2, 60), (11, 60), (400, 30), (5000, 300), (5001, 1000)])
+def test_ramp_iter_matches_ramp(sim, n_steps, rpm):
+    stepper = make_stepper()
+    profile = stepper.ramp(n_steps, rpm)
+    pauses = list(stepper.ramp_iter(n_steps, rpm))
+    assert len(profile) == len(pauses) == n_steps
+    np.testing.assert_allclose(profile.to_array(), pauses)
+    np.testing.assert_allclose(list(profile), pauses)
+    assert profile[-1] == pytest.approx(pauses[-1])
+
+
+def test_ramp_is_symmetric_and_capped(sim):
+    stepper = make_stepper()
+    pauses = stepper.ramp(1000, 120).to_array()
+    np.testing.assert_allclose(pauses, pauses[::-1])
+    assert pauses.min() == pytest.approx(60 / (stepper.STEPS_PER_REV * 120))
+    assert pauses[0] == pytest.approx(60 / (stepper.STEPS_PER_REV * stepper.START_RPM))
+
+
+def baseline_ramp(stepper, n_steps, target_rpm):
+    """
+    The list based ramp() that RampProfile replaced
+    """
+    target_pause_per_step = 1/(stepper.STEPS_PER_REV * target_rpm/60)
+    pauses = []
+    pause = 1/(stepper.STEPS_PER_REV * stepper.START_RPM / 60)
+    elapsed = 0
+    current_rpm = stepper.START_RPM
+    step_count = 0
+    while (step_count < n_steps/2) & (current_rpm < target_rpm):
+        pauses.append(pause)
+        elapsed += pause
+        current_rpm = stepper.START_RPM + (elapsed * stepper.ACCEL)
+        pause = 1/(stepper.STEPS_PER_REV * current_rpm / 60)
+        step_count += 1
+    pauses.extend([target_pause_per_step for i in range(int(n_steps/2) - step_count)])
+    if n_steps > 1:
+        pauses.extend(list(reversed(pauses)))
+    return pauses
+
+
+@pytest.mark.parametrize("n_steps, rpm", [(2, 60), (100, 120), (800, 120), (2000, 600), (5000, 300)])
+def test_ramp_matches_baseline(sim, n_steps, rpm):
+    stepper = make_stepper(steps_per_rev=400)
+    assert list(stepper.ramp(n_steps, rpm)) == baseline_ramp(stepper, n_steps, rpm)
+
+
+def test_ramp_slices():
+    profile = RampProfile(np.array([0.3, 0.2]), 3, 0.1)
+    assert profile[1:6] == [0.2, 0.1, 0.1, 0.1, 0.2]
+    assert profile[::-1] == list(profile)[::-1]
+    assert profile[-1] == 0.3
+
+
+def test_ramp_cache_is_invalidated(sim):
+    stepper = make_stepper()
+    profile = stepper.ramp(100, 60)
+    assert stepper.ramp(100, 60) is profile
+    stepper.set_acceleration(acceleration=1200)
+    assert stepper.ramp(100, 60) is not profile
+
+
+def pulse_times(sim, pin):
+    return np.array([t for t, level in sim.transitions(pin) if level])
+
+
+def test_move_async_cancel_decelerates_along_the_ramp(sim):
+    stepper = make_stepper()
+    n_accel = len(stepper._ramp_shape(2000, 300)[0])
+
+    def cancel_at_cruise(level):
+        if level and len(pulse_times(sim, stepper.STEP)) == n_accel + 50:
+            stepper._active_move.cancel()
+    sim.watch_output(stepper.STEP, cancel_at_cruise)
+    move = stepper.move_async(2000, rpm=300)
+    assert move.result(timeout=5) == 2*n_accel + 50
+    assert move.cancelled() and move.progress < 1
+    pauses = np.diff(pulse_times(sim, stepper.STEP))[-n_accel:]
+    assert np.all(np.diff(pauses) > 0)
+    assert pauses[-1] == pytest.approx(stepper.ramp(2000, 300)[0], rel=0.01)
+
+
+def test_move_async_result_reraises_worker_exceptions(sim, monkeypatch):
+    stepper = make_stepper()
+
+    def broken_pulse(*args):
+        raise ValueError("driver fault")
+    monkeypatch.setattr(stepper, "_pulse", broken_pulse)
+    move = stepper.move_async(10)
+    with pytest.raises(ValueError):
+        move.result(timeout=5)
+    assert move.done()
+
+
+def test_only_one_move_at_a_time(sim):
+    stepper = make_stepper()
+    release = threading.Event()
+    sim.watch_output(stepper.STEP, lambda level: release.wait(5))
+    move = stepper.move_async(5, use_ramp=False)
+    with pytest.raises(RuntimeError):
+        stepper.move_async(5)
+    release.set()
+    assert move.result(timeout=5) == 5
+    assert stepper.move_async(3, use_ramp=False).result(timeout=5) == 3
+
+
+def test_step_timing_stats_and_histogram():
+    timing = StepTiming(capacity=4, tolerance=0.001)
+    assert timing.stats() == {"n": 0, "dropped": 0}
+    for i, late in enumerate([0.0, 0.0005, 0.002, -0.0005, 0.0]):
+        timing.record(i * 0.01, i * 0.01 + late)
+    stats = timing.stats()
+    assert (stats["n"], stats["dropped"], stats["missed"]) == (4, 1, 1)
+    assert stats["max"] == pytest.approx(0.002)
+    assert stats["mean"] == pytest.approx(0.0005)
+    assert stats["steps_per_sec"] == pytest.approx(3 / 0.0295)
+    counts, edges = timing.histogram(bins=5)
+    assert counts.sum() == 4
+    assert (edges[0], edges[-1]) == (pytest.approx(-0.0005), pytest.approx(0.002))
+
+
+def test_step_records_timing_only_when_enabled(sim):
+    stepper = make_stepper()
+    timing = stepper.enable_timing()
+    stepper.step(20, rpm=120)
+    assert timing.n == 20
+    # the sim clock never runs late
+    assert timing.stats()["missed"] == 0
+    stepper.disable_timing()
+    stepper.step(5, rpm=120)
+    assert timing.n == 20
+
+
+def rising_edges(sim, pin):
+    return sum(level for t, level in sim.transitions(pin))
+
+
+@pytest.mark.parametrize("deltas", [[10, 3, -7], [-5, 5, 0], [1, 100, 37]])
+def test_multistepper_distributes_steps(sim, deltas):
+    steppers = [make_stepper(offset=6 * i) for i in range(len(deltas))]
+    n_steps = MultiStepper(steppers).move(deltas, rpm=600, use_ramp=False)
+    assert n_steps == max(abs(delta) for delta in deltas)
+    for stepper, delta in zip(steppers, deltas):
+        assert rising_edges(sim, stepper.STEP) == abs(delta)
+        if delta:
+            assert sim.levels[stepper.DIR] == int(delta > 0)
+
+
+def test_multistepper_steps_are_evenly_spread(sim):
+    steppers = [make_stepper(offset=0), make_stepper(offset=6)]
+    MultiStepper(steppers).move([12, 4], rpm=600, use_ramp=False)
+    dominant = [t for t, level in sim.transitions(steppers[0].STEP) if level]
+    minor = [t for t, level in sim.transitions(steppers[1].STEP) if level]
+    # each minor axis step coincides with a dominant step, one every 3
+    positions = [dominant.index(t) for t in minor]
+    assert np.diff(positions).tolist() == [3, 3, 3]
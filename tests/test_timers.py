@@ -0,0 +1,25 @@
+import threading
+
+from rpigpio.timers import TimerQueue, timer_queue
+
+
+def test_timer_queue_runs_in_due_order():
+    queue = TimerQueue()
+    ran = []
+    done = threading.Event()
+    queue.schedule(0.03, ran.append, 3)
+    queue.schedule(0.01, ran.append, 1)
+    queue.schedule(0.02, ran.append, 2).cancel()
+    queue.schedule(0.04, done.set)
+    assert done.wait(2)
+    assert ran == [1, 3]
+
+
+def test_timers_follow_the_sim_clock(sim):
+    assert timer_queue.source is sim
+    ran = []
+    timer_queue.schedule(0.5, ran.append, sim.clock.now)
+    sim.clock.advance(0.4)
+    assert ran == []
+    sim.clock.advance(0.2)
+    assert len(ran) == 1
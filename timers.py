@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+"""
+Shared timer queue, so device classes can schedule timeouts (long presses,
+debounce windows, ...) without sleeping in GPIO callbacks or starting a thread each.
+"""
+
+
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+
+class TimerHandle():
+    def __init__(self, at, func, args):
+        """
+        A scheduled call, returned by TimerQueue.schedule()
+
+        args:
+            at: (float) time.monotonic() the call is due
+            func: callable
+            args: tuple of arguments for func
+        """
+        self.at = at
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerQueue():
+    def __init__(self, max_wait=0.1):
+        """
+        Runs scheduled calls on one daemon thread, in due order. Pending calls are kept
+        in a heap, so scheduling and cancelling are O(log n) and O(1). Calls should be short,
+        as a slow one delays the rest.
+
+        args:
+            max_wait: (float) longest the thread sleeps before re-reading the clock, so
+                      the queue also follows a patched clock (see sim.VirtualClock)
+        """
+        self.MAX_WAIT = max_wait
+        self.errors = 0  # calls that raised
+        self.source = None  # set with use_source()
+        self._heap = []  # (at, seq, TimerHandle)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def use_source(self, source):
+        """
+        Hand calls scheduled from now on to source instead of the timer thread. The sim
+        backend (sim.SimGPIO) installs itself here, so timers fire as its virtual clock
+        reaches them, in order with the scripted waveforms.
+
+        args:
+            source: object with now() (current time, seconds) and schedule(at, func),
+                    or None to go back to the timer thread
+        """
+        self.source = source
+
+    def schedule(self, delay, func, *args):
+        """
+        Call func(*args) on the timer thread after delay seconds. Returns a TimerHandle
+
+        args:
+            delay: (float) seconds
+            func: callable
+        """
+        source = self.source
+        if source is not None:
+            handle = TimerHandle(source.now() + delay, func, args)
+            source.schedule(handle.at, lambda: self._call(handle))
+            return handle
+        handle = TimerHandle(time.monotonic() + delay, func, args)
+        with self._cond:
+            heapq.heappush(self._heap, (handle.at, next(self._seq), handle))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return handle
+
+    def _next_due(self):
+        """
+        Wait for the next due call that hasn't been cancelled and return it
+        """
+        while True:
+            now = time.monotonic()  # read outside the lock: a patched clock may run callbacks that schedule
+            with self._cond:
+                while self._heap and self._heap[0][2].cancelled:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                handle = self._heap[0][2]
+                if handle.at <= now:
+                    heapq.heappop(self._heap)
+                    return handle
+                self._cond.wait(min(handle.at - now, self.MAX_WAIT))
+
+    def _call(self, handle):
+        if handle.cancelled:
+            return
+        try:
+            handle.func(*handle.args)
+        except Exception:
+            self.errors += 1
+            traceback.print_exc()
+
+    def _run(self):
+        while True:
+            self._call(self._next_due())
+
+
+# Queue shared by the device classes
+timer_queue = TimerQueue()
+
+
+if __name__ == "__main__":
+    start = time.monotonic()
+    for delay in [0.3, 0.1, 0.2]:
+        timer_queue.schedule(delay, lambda d: print("{}s timer ran at {:.3f}s".format(d, time.monotonic() - start)), delay)
+    timer_queue.schedule(0.15, print, "cancelled").cancel()
+    time.sleep(0.5)
@@ -5,16 +5,19 @@ Class to handle toggle switch inputs
 """
 
 
-import RPi.GPIO as GPIO
 import time
 
 if __name__ == "__main__":
     from base import BaseIO
+    from gpio import GPIO
+    from debounce import Debouncer
 else:
     from rpigpio.base import BaseIO
+    from rpigpio.gpio import GPIO
+    from rpigpio.debounce import Debouncer
 
 class Toggle(BaseIO):
-    def __init__(self, toggle_pin=4, debounce_delay_secs=0.05):
+    def __init__(self, toggle_pin=4, debounce_delay_secs=0.05, dispatcher=None):
         """
         Class to handle toggle switch input
         
@@ -22,7 +25,8 @@ class Toggle(BaseIO):
             toggle_pin: (int) GPIO pin (BCM) for the encoder SW pin
             toggle_on_func: optional function to call when toggle_on callback is triggered
             toggle_off_func: optional function to call when toggle_off callback is triggered
-            debounce_delay_secs: (float) seconds delay to handle debouncing 
+            debounce_delay_secs: (float) seconds the level must be stable for (see Debouncer)
+            dispatcher: optional EdgeDispatcher to receive edges from
         """
         GPIO.setmode(GPIO.BCM)
         
@@ -32,30 +36,32 @@ class Toggle(BaseIO):
         
         # setup callbacks
         self.DEBOUNCE_DELAY_SECS = debounce_delay_secs
-        self.LAST_DEBOUNCE_TIME = time.time()
-        
-        # read initial state:
-        self.STATE = GPIO.input(self.TOGGLE)
+        self.debouncer = Debouncer(self.TOGGLE, debounce_delay_secs, pressed_level=1, dispatcher=dispatcher)
         
+    @property
+    def STATE(self):
+        return self.debouncer.state
+
+    @property
+    def LAST_DEBOUNCE_TIME(self):
+        return self.debouncer.last_change
+
     def get_state(self):
         """
         Return True or False depending on toggle state.
-        Includes some debouncing logic
+        Returns the debounced state immediately
         """
-        read_time = time.time()
-        
-        if (read_time - self.LAST_DEBOUNCE_TIME) < self.DEBOUNCE_DELAY_SECS:
-            time.sleep(self.DEBOUNCE_DELAY_SECS)
-        
-        # get reading
-        state = GPIO.input(self.TOGGLE)
-        
-        # handle change in state
-        if state != self.STATE:
-            self.LAST_DEBOUNCE_TIME = read_time
-            self.STATE = state
-        
-        return self.STATE
+        return self.debouncer.get_state()
+
+    def wait_for_press(self, timeout=None):
+        """
+        Block until the toggle is switched on. Returns the timestamp, or None on timeout
+        """
+        return self.debouncer.wait_for_press(timeout)
+
+    @property
+    def presses(self):
+        return self.debouncer.presses
 
 if __name__ == "__main__":
     try: